@@ -0,0 +1,57 @@
+"""
+Persistent lower bounds for the length of solutions. Whenever a search rules
+out every series of commands up to some length between two states that fact
+is stored in bounds.bin, so that the same fruitless search never needs to be
+repeated. A known solution that is only one step longer than the bound is
+proven to be the shortest possible without any search at all.
+
+Note: the bounds are only valid for the graph they were found in. bounds.bin
+      starts with the fingerprint of the model (see
+      transitions.model_fingerprint), and the bounds of another model are
+      ignored and replaced by the first one recorded.
+"""
+
+import pathlib
+import transitions
+
+# Binary file to store the lower bounds:
+BOUNDS_FILE = pathlib.Path(__file__).parent.absolute().as_posix() + "/bounds.bin"
+
+# The model fingerprint 8 bytes followed by 17 byte records: initial state 8 bytes, desired state 8 bytes, ruled out
+# length 1 byte
+_HEADER_SIZE = 8
+_RECORD_SIZE = 17
+
+_ruled_out: dict[tuple[int, int], int] | None = None
+# Whether BOUNDS_FILE is of the current model, i.e. can be appended to
+_file_matches = False
+
+def _load() -> dict[tuple[int, int], int]:
+    global _ruled_out, _file_matches
+    if _ruled_out is None:
+        _ruled_out = {}
+        _file_matches = False
+        if pathlib.Path(BOUNDS_FILE).exists():
+            with open(BOUNDS_FILE, "rb") as f:
+                _file_matches = f.read(_HEADER_SIZE) == transitions.model_fingerprint()
+                while _file_matches and len(data := f.read(_RECORD_SIZE)) == _RECORD_SIZE:
+                    key = (int.from_bytes(data[:8], byteorder='big'), int.from_bytes(data[8:16], byteorder='big'))
+                    _ruled_out[key] = max(_ruled_out.get(key, 0), data[16])
+    return _ruled_out
+
+# There is no solution of this length or shorter between the encoded states
+def get_ruled_out_length(state: int, endstate: int) -> int:
+    return _load().get((state, endstate), 0)
+
+def record_ruled_out_length(state: int, endstate: int, length: int):
+    global _file_matches
+    ruled_out = _load()
+    length = min(length, 255)
+    if length <= ruled_out.get((state, endstate), 0):
+        return
+    ruled_out[(state, endstate)] = length
+    with open(BOUNDS_FILE, "ab" if _file_matches else "wb") as f:
+        if not _file_matches:
+            f.write(transitions.model_fingerprint())
+            _file_matches = True
+        f.write(state.to_bytes(8, byteorder='big') + endstate.to_bytes(8, byteorder='big') + bytes([length]))
@@ -1,7 +1,11 @@
 """
 Tests every relevant scenario for initial and desired states for each led
-device. The solutions that take more than 200ms to compute will be appended to
-cache.bin. Such cached solutions can be requested via get_cached.
+device. The solutions that take a search at least CACHE_SEARCH_DEPTH deep to
+find will be appended to cache.bin. Such cached solutions can be requested via
+get_cached, or many at once via get_cached_many. The search depth, unlike the
+time taken, doesn't depend on the machine, so the cache is the same wherever
+it's built. Run this script with --full to cache every solution instead,
+keeping the costliest ones that fit CACHE_FULL_BUDGET_BYTES.
 The script also, luckily, confirms that no state combination is mathematically
 impossible to solve.
 
@@ -9,89 +13,535 @@ Note: The cache supports only one target state at a time. Combinations can be
       solved for by appending cached results for one target state at a time or
       by forgoing the cache completely.
 
+Also note: the calibration targets (SPECIAL_TARGET_STATES) are cached
+           separately by running this script with --special, which requires
+           graph.bin (see graph.py). Every combination is cached for these so
+           that calibrating never requires a search. For the potled only the
+           steps to return after POTLED_CALIBRATION_PHASE are stored. Pausing
+           and unpausing are always a single FRONT_PLAYPAUSE if effective.
+
+Run this script with --pack to write cache.pack, a compact form of cache.bin
+that is kept in memory for lookups (see Pack). It's memory-mapped, so any
+number of processes share one copy of it.
+
+A record is for every on/off variant of its state combination that its
+solution works for (see regroup), so a lookup is a single probe. Run this
+script with --canonicalize to regroup a cache.bin built before that.
+
+Run this script with --verify to replay every cached solution both through
+the current perform_command and through the spec tables that lookups use (see
+transitions.replays_to) and to list the stale ones, or with --verify --drop to
+also remove them (see verify).
+
+Run this script with --warm to cache the requests that have missed the cache
+and take a deep search to solve (see journal_miss). Preferably run it regularly
+so that the cache follows the actual usage.
+
+Run this script with --report (workload log) to see how many of the requests
+in the log the cache answers (see main.read_workload_log).
+
 More important note: Running this script will take several hours, probably
                      days. However, without the cache some solutions can take
                      seconds to compute. Moreover reading from the cache is
-                     very fast, to the extent that there was no practical
-                     reason to implement prereading it to memory for O(1)
-                     access. In other words, caching guarantees that this
-                     solver is practical for use between button presses.
+                     very fast: a lookup is a binary search of cache.bin, or
+                     of the memory-mapped cache.pack when one has been
+                     written, and get_cached_many answers a batch of requests
+                     in one pass. In other words, caching guarantees that
+                     this solver is practical for use between button presses.
 """
 
 import solver
-from configuration import is_state_setting_effective, get_commands_for_relative_state
+from configuration import is_state_setting_effective, get_commands_for_relative_state, convert_target_state
 from configuration import Command, State, COMMANDS, BACKLED_MODES, FRONTLED_MODES, POTLED_MODES, RELATIVE_STATES
+from configuration import POTLED_CALIBRATION_PHASE, perform_command
+import array
+import dataclasses
 import pathlib
 
 # Binary file to store the cached solutions:
 CACHE_FILE = pathlib.Path(__file__).parent.absolute().as_posix() + "/cache.bin"
-# Only cache solutions that took longer than this to find:
-CACHE_SLOWER_THAN_MS = 200
-# check if an adjacent state with a device on/off has been cached and works as a solution for this state too:
+# Only cache solutions that take a search at least this deep to find without the cache (see solver.search_depth):
+CACHE_SEARCH_DEPTH = 3
+# Upper bound for the size of cache.bin when caching every solution (--full):
+CACHE_FULL_BUDGET_BYTES = 64 * 1024 * 1024
+# Compact form of CACHE_FILE that is used instead if it exists (see pack):
+CACHE_PACK_FILE = pathlib.Path(__file__).parent.absolute().as_posix() + "/cache.pack"
+# Amount of records in each block of the pack:
+PACK_BLOCK_SIZE = 64
+# Text file with the fingerprint of the model the cache was verified against (see verify):
+FINGERPRINT_FILE = pathlib.Path(__file__).parent.absolute().as_posix() + "/cache.fingerprint"
+# Ignore the cache if the model has changed since it was verified:
+VERIFY_MODEL_FINGERPRINT = True
+# Journal the requests that miss the cache so that they can be cached later (see warm):
+JOURNAL_MISSES = True
+# Binary file to journal the requests that missed the cache:
+JOURNAL_FILE = pathlib.Path(__file__).parent.absolute().as_posix() + "/misses.bin"
+# Use the solution cached for an adjacent state with a device off for this state too if it works (see regroup):
 DEVICE_TOGGLING_OPTIMIZATION = True
+# The state combination takes the lowest bits of the 4 byte key of a record and the on/off variants the solution
+# is for (see regroup) the highest 8 bits from this one on:
+VARIANT_MASK_SHIFT = 24
 
 TARGET_STATES = BACKLED_MODES + FRONTLED_MODES + POTLED_MODES \
                  + [st1 for st1, _ in RELATIVE_STATES] + [st2 for _, st2 in RELATIVE_STATES] \
                  + ["backled off", "backled on", "frontled off", "frontled on", "potled off", "potled on"]
 
+SPECIAL_TARGET_STATES = ["frontled calibrate", "potled calibrate"]
+# The special state combinations are indexed after all the others:
+SPECIAL_INDEX_OFFSET = len(BACKLED_MODES) * len(FRONTLED_MODES) * len(POTLED_MODES) * len(TARGET_STATES) * 8
+
+# The positions of the target states for encoding the state combinations:
+_TARGET_INDICES = {target_state: i for i, target_state in enumerate(TARGET_STATES)}
+_SPECIAL_TARGET_INDICES = {target_state: i for i, target_state in enumerate(SPECIAL_TARGET_STATES)}
+
 def get_cached(initial_states: list[str], target_state: str) -> list[Command] | None:
-    if target_state in ["frontled paused", "frontled unpaused", "frontled calibrate", "potled calibrate"]: # Exception to what's cached
-        return None
-    
-    decoded_initial_state = solver.read_state(State(), initial_states)
+    return get_cached_for_state(solver.read_state(State(), initial_states), target_state)
+
+def get_cached_for_state(decoded_initial_state: State, target_state: str) -> list[Command] | None:
+    if target_state in ["frontled paused", "frontled unpaused"]:
+        return [Command.FRONT_PLAYPAUSE] if is_state_setting_effective(decoded_initial_state, target_state) else None
+    if target_state in SPECIAL_TARGET_STATES:
+        return get_cached_special(decoded_initial_state, target_state)
+
     decoded_desired_state = solver.read_state(decoded_initial_state, [target_state])
 
     return get_cached_internal(decoded_initial_state, decoded_desired_state, target_state)
 
+# A single probe for the records of the on/off variants of the state
+# combination, which tell the variants each solution is for (see regroup). The
+# solution is verified once, as the initial state may have more to it than the
+# state combination tells, e.g. relative changes while chaining cached solutions
+# (see solver.solve_compound).
 def get_cached_internal(decoded_initial_state: State, decoded_desired_state: State, target_state: str):
-    import dataclasses
+    import transitions
 
-    if DEVICE_TOGGLING_OPTIMIZATION:
-        if decoded_initial_state.backled_on == 1 and target_state not in ["backled off", "backled on"]:
-            new_initial_state = dataclasses.replace(decoded_initial_state)
-            new_initial_state.backled_on = 0
-            new_desired_state = dataclasses.replace(decoded_desired_state)
-            new_desired_state.backled_on = 0
-            candidate = get_cached_internal(new_initial_state, new_desired_state, target_state)
-            if solver.is_solution(candidate, decoded_initial_state, decoded_desired_state):
-                return candidate
-            
-        if decoded_initial_state.frontled_on == 1 and target_state not in ["frontled off", "frontled on"]:
-            new_initial_state = dataclasses.replace(decoded_initial_state)
-            new_initial_state.frontled_on = 0
-            new_desired_state = dataclasses.replace(decoded_desired_state)
-            new_desired_state.frontled_on = 0
-            candidate = get_cached_internal(new_initial_state, new_desired_state, target_state)
-            if solver.is_solution(candidate, decoded_initial_state, decoded_desired_state):
-                return candidate
-            
-        if decoded_initial_state.potled_on == 1 and target_state not in ["potled off", "potled on"]:
-            new_initial_state = dataclasses.replace(decoded_initial_state)
-            new_initial_state.potled_on = 0
-            new_desired_state = dataclasses.replace(decoded_desired_state)
-            new_desired_state.potled_on = 0
-            candidate = get_cached_internal(new_initial_state, new_desired_state, target_state)
-            if solver.is_solution(candidate, decoded_initial_state, decoded_desired_state):
-                return candidate
-    
-    return get_cached_internal0(decoded_initial_state, target_state)
+    candidate = get_cached_internal0(decoded_initial_state, target_state)
+    if candidate is not None and transitions.replays_to(candidate, decoded_initial_state, decoded_desired_state):
+        return candidate
+    return None
 
 def get_cached_internal0(decoded_initial_state: State, target_state: str):
-    i = encode_state_combination(decoded_initial_state, target_state)
+    return find_variant(encode_state_combination(decoded_initial_state, target_state))
+
+# Same as get_cached_for_state for many (initial state, target state) pairs at
+# once, the solutions in the same order. The state combinations are sorted so
+# that the cache is read in a single forward pass (see records_of_many).
+def get_cached_many(queries: list[tuple[State, str]]) -> list[list[Command] | None]:
+    import transitions
+
+    solutions: list[list[Command] | None] = [None] * len(queries)
+    indices = []
+    for n, (decoded_initial_state, target_state) in enumerate(queries):
+        if target_state in ["frontled paused", "frontled unpaused"] + SPECIAL_TARGET_STATES:
+            solutions[n] = get_cached_for_state(decoded_initial_state, target_state)
+        else:
+            indices.append((encode_state_combination(decoded_initial_state, target_state), n))
+    indices.sort()
+    decoded: dict[int, list[Command]] = {} # encoded solution -> solution
+    for (index, n), records in zip(indices, records_of_many([index - index % 8 for index, _ in indices])):
+        for key, encoded in records:
+            if split_key(key)[1] >> index % 8 & 1:
+                if encoded not in decoded:
+                    decoded[encoded] = decode_solution(encoded)
+                decoded_initial_state, target_state = queries[n]
+                decoded_desired_state = solver.read_state(decoded_initial_state, [target_state])
+                if transitions.replays_to(decoded[encoded], decoded_initial_state, decoded_desired_state):
+                    solutions[n] = list(decoded[encoded])
+                break
+    return solutions
+
+def get_cached_special(decoded_initial_state: State, target_state: str) -> list[Command] | None:
+    solution = find(encode_special_combination(decoded_initial_state, target_state))
+    if solution is not None and target_state == "potled calibrate":
+        return POTLED_CALIBRATION_PHASE + solution
+    return solution
+
+# Appends the request to the journal of misses that warm reads: 8 byte records
+# of state combination 4 bytes and milliseconds taken to solve it 4 bytes.
+def journal_miss(decoded_initial_state: State, target_state: str, duration_ms: int):
+    index = encode_state_combination(decoded_initial_state, target_state)
+    with open(JOURNAL_FILE, "ab") as f:
+        f.write(index.to_bytes(4, byteorder='big') + min(duration_ms, 0xFFFFFFFF).to_bytes(4, byteorder='big'))
+
+# The longest time taken to solve each journaled state combination
+def read_journal() -> dict[int, int]:
+    durations: dict[int, int] = {}
+    if pathlib.Path(JOURNAL_FILE).exists():
+        with open(JOURNAL_FILE, "rb") as f:
+            while len(data := f.read(8)) == 8:
+                index = int.from_bytes(data[:4], byteorder='big')
+                durations[index] = max(durations.get(index, 0), int.from_bytes(data[4:], byteorder='big'))
+    return durations
+
+# Caches the journaled misses, and as the same modes are likely to be requested
+# again, the state combinations differing from them only by the devices being
+# on or off. Like when building the cache, only the solutions that take a
+# search at least CACHE_SEARCH_DEPTH deep are cached. The journal is emptied
+# afterwards.
+def warm():
+    import time
+
+    lines = []
+    handled = set()
+    journal = read_journal()
+    for index in journal:
+        decoded_state, target_state = decode_state_combination(index)
+        for backled_on in [0, 1]:
+            for frontled_on in [0, 1]:
+                for potled_on in [0, 1]:
+                    decoded_initial_state = dataclasses.replace(decoded_state, backled_on=backled_on,
+                                                                frontled_on=frontled_on, potled_on=potled_on)
+                    nearby_index = encode_state_combination(decoded_initial_state, target_state)
+                    if nearby_index in handled or not is_state_setting_effective(decoded_initial_state, target_state):
+                        continue
+                    handled.add(nearby_index)
+                    decoded_desired_state = solver.read_state(decoded_initial_state, [target_state])
+                    if solver.search_depth(decoded_initial_state, decoded_desired_state) < CACHE_SEARCH_DEPTH \
+                            or get_cached_internal(decoded_initial_state, decoded_desired_state, target_state) is not None:
+                        continue
+                    start = time.time()
+                    solution = solver.solve_internal(decoded_initial_state, decoded_desired_state)
+                    if solution is None or not solver.is_solution(solution, decoded_initial_state, decoded_desired_state):
+                        continue
+                    encoded = encode_solution(solution)
+                    if encoded < 1 << 32:
+                        lines.append((nearby_index, encoded))
+                    print("{} -> {}: {} in {} s".format(solver.describe_state(decoded_initial_state), target_state,
+                                                        [command.name for command in solution], time.time() - start))
+    if lines:
+        merge_records(lines, regroup_added=True)
+    pathlib.Path(JOURNAL_FILE).unlink(missing_ok=True)
+    print("Cached {} solutions for {} journaled misses".format(len(lines), len(journal)))
+
+def find(i: int) -> list[Command] | None:
+    if not model_matches():
+        return None
+    pack = load_pack()
+    if pack is not None:
+        return find_packed(pack, i)
+    return find_in_file(i)
+
+# The solution for the state combination from the records of its on/off
+# variants, which are next to each other
+def find_variant(i: int) -> list[Command] | None:
+    if not model_matches():
+        return None
+    base = i - i % 8
+    pack = load_pack()
+    records = packed_records_between(pack, base, base + 8) if pack is not None else records_in_file_between(base, base + 8)
+    for key, encoded in records:
+        if split_key(key)[1] >> i % 8 & 1:
+            return decode_solution(encoded)
+    return None
+
+# The records of the on/off variants of each of the state combinations (see
+# find_variant), which are given in order, the lowest variant of each. Each
+# binary search over cache.bin starts where the one before left off, and the
+# pack is decoded on from where the previous state combination left off unless
+# the next one is in a later block.
+def records_of_many(bases: list[int]) -> list[list[tuple[int, int]]]:
+    import os
+    if not model_matches():
+        return [[] for _ in bases]
+    pack = load_pack()
+    if pack is not None:
+        return packed_records_of_many(pack, bases)
+    records_of_bases = []
+    with open(CACHE_FILE, "rb") as f:
+        size = os.fstat(f.fileno()).st_size // 8
+        low = 0
+        for base in bases:
+            if records_of_bases and base == previous:
+                records_of_bases.append(records_of_bases[-1])
+                continue
+            high = size
+            while low < high:
+                middle = (low + high) // 2
+                f.seek(middle * 8)
+                if split_key(int.from_bytes(f.read(4), byteorder='big'))[0] < base:
+                    low = middle + 1
+                else:
+                    high = middle
+            f.seek(low * 8)
+            data = f.read(64) # a record at most for each variant
+            records = []
+            for i in range(0, len(data), 8):
+                key = int.from_bytes(data[i:i+4], byteorder='big')
+                if split_key(key)[0] >= base + 8:
+                    break
+                records.append((key, int.from_bytes(data[i+4:i+8], byteorder='big')))
+            records_of_bases.append(records)
+            previous = base
+    return records_of_bases
+
+# The state combination and the on/off variants of it the record is for as a
+# bitmask, bit n being the variant i - i % 8 + n. Records without any (built
+# before regroup, and the special ones) are only for their own.
+def split_key(key: int) -> tuple[int, int]:
+    index = key & (1 << VARIANT_MASK_SHIFT) - 1
+    variants = key >> VARIANT_MASK_SHIFT
+    if variants == 0 and index < SPECIAL_INDEX_OFFSET:
+        variants = 1 << index % 8
+    return index, variants
+
+_model_matches: tuple[str, bool] | None = None
+
+# Whether the model is the one the cache was last verified against. The cache
+# is ignored otherwise, as its solutions may no longer be solutions at all.
+def model_matches() -> bool:
+    global _model_matches
+    if not VERIFY_MODEL_FINGERPRINT:
+        return True
+    if _model_matches is None or _model_matches[0] != FINGERPRINT_FILE:
+        matches = True # never verified, trusted as before
+        if pathlib.Path(FINGERPRINT_FILE).exists():
+            import transitions
+            matches = bytes.fromhex(pathlib.Path(FINGERPRINT_FILE).read_text().strip()) == transitions.model_fingerprint()
+            if not matches:
+                print("Warning: the model has changed since the cache was verified, ignoring the cache. "
+                      "Run cache.py --verify --drop to fix it.")
+        _model_matches = (FINGERPRINT_FILE, matches)
+    return _model_matches[1]
+
+def stamp_fingerprint():
+    global _model_matches
+    import transitions
+    pathlib.Path(FINGERPRINT_FILE).write_text(transitions.model_fingerprint().hex() + "\n")
+    _model_matches = None
+
+def find_in_file(i: int) -> list[Command] | None:
+    for key, encoded in records_in_file_between(i, i + 1):
+        return decode_solution(encoded)
+    return None
+
+# The (key, encoded solution) records of the state combinations from low up to
+# high. Binary search over the records sorted by their state combinations as
+# the special ones come after the rest.
+def records_in_file_between(low_index: int, high_index: int) -> list[tuple[int, int]]:
+    import os
+    records = []
     with open(CACHE_FILE, "rb") as f:
-        while data := f.read(8): # 8 byte chucks: state combination 4 bytes, its solution 4 bytes
-            index = int.from_bytes(data[:4], byteorder='big')
-            if index == i:
-                return decode_solution(int.from_bytes(data[4:], byteorder='big'))
-            if index > i:
-                return None
+        low, high = 0, os.fstat(f.fileno()).st_size // 8 # 8 byte chucks: key 4 bytes, solution 4 bytes
+        while low < high:
+            middle = (low + high) // 2
+            f.seek(middle * 8)
+            if split_key(int.from_bytes(f.read(4), byteorder='big'))[0] < low_index:
+                low = middle + 1
+            else:
+                high = middle
+        f.seek(low * 8)
+        while len(data := f.read(8)) == 8:
+            key = int.from_bytes(data[:4], byteorder='big')
+            if split_key(key)[0] >= high_index:
+                break
+            records.append((key, int.from_bytes(data[4:], byteorder='big')))
+    return records
+
+# The pack is a compact form of cache.bin that is small enough to be kept in
+# memory. Only a few thousand distinct solutions are cached, so each is stored
+# once in a dictionary ordered by frequency, and the records refer to them by
+# their index. The records are split into blocks of PACK_BLOCK_SIZE: the
+# first state combination of each block is stored in full and the rest as the
+# difference to the previous one. Both the differences and the indices are
+# stored as varints (7 bits per byte, the high bit telling if more follow).
+# The pack also holds the fingerprint of the model it was packed with, and a
+# pack of another model is ignored.
+# Layout, all integers 4 byte big-endian unless told otherwise:
+#   magic b"IRC4", model fingerprint 8 bytes, record count, solution count,
+#   block count
+#   solutions: the encoded solutions (see encode_solution)
+#   blocks: the first state combination and the offset of the block in stream
+#   stream: per record the varint difference minus 1 (not for the first one of
+#           the block) shifted left by one, the lowest bit telling if the byte
+#           of the variants it's for (see split_key) follows, the varint index
+#           of its solution, and the byte of the variants if told so. The byte
+#           is left out when it's the one implied by the state combination
+#           (see _implied_variants), which it is for most records. It's always
+#           there for the first record of the block.
+@dataclasses.dataclass
+class Pack:
+    fingerprint: bytes
+    record_count: int
+    solutions: array.array
+    first_indices: array.array
+    offsets: array.array
+    stream: bytes | memoryview
+
+_PACK_MAGIC = b"IRC4"
+
+def pack(records: list[tuple[int, int]]) -> bytes:
+    from collections import Counter
+    import transitions
+    frequencies = Counter(encoded for _, encoded in records)
+    solutions = [encoded for encoded, _ in frequencies.most_common()]
+    solution_ids = {encoded: solution_id for solution_id, encoded in enumerate(solutions)}
+    blocks = []
+    stream = bytearray()
+    previous = 0
+    for n, (key, encoded) in enumerate(records):
+        index = key & (1 << VARIANT_MASK_SHIFT) - 1
+        variants = key >> VARIANT_MASK_SHIFT
+        explicit = variants != _implied_variants(index)
+        if n % PACK_BLOCK_SIZE == 0:
+            blocks.append((index, len(stream)))
+            explicit = True
+        else:
+            _write_varint(stream, (index - previous - 1) << 1 | explicit)
+        _write_varint(stream, solution_ids[encoded])
+        if explicit:
+            stream.append(variants)
+        previous = index
+    header = [len(records), len(solutions), len(blocks)]
+    return _PACK_MAGIC + transitions.model_fingerprint() + b"".join(value.to_bytes(4, byteorder='big') for value in header) \
+        + b"".join(encoded.to_bytes(4, byteorder='big') for encoded in solutions) \
+        + b"".join(index.to_bytes(4, byteorder='big') + offset.to_bytes(4, byteorder='big') for index, offset in blocks) \
+        + bytes(stream)
+
+# Only the solutions and the blocks are copied, the stream is used as is: given
+# a memory-mapped file (see load_pack) it's shared by every process using it.
+def unpack(data: bytes | memoryview) -> Pack:
+    import sys
+    assert data[:4] == _PACK_MAGIC, "Not a cache pack"
+    fingerprint = bytes(data[4:12])
+    record_count, solution_count, block_count = [int.from_bytes(data[i:i+4], byteorder='big') for i in range(12, 24, 4)]
+    solutions = array.array('I')
+    solutions.frombytes(data[24:24 + solution_count * 4])
+    blocks_start = 24 + solution_count * 4
+    blocks = array.array('I')
+    blocks.frombytes(data[blocks_start:blocks_start + block_count * 8])
+    if sys.byteorder == "little":
+        solutions.byteswap()
+        blocks.byteswap()
+    return Pack(fingerprint, record_count, solutions, blocks[0::2], blocks[1::2], data[blocks_start + block_count * 8:])
+
+_loaded_pack: tuple[str, Pack | None] | None = None
+
+# The pack is memory-mapped rather than read, so processes using it, e.g. the
+# workers of solver.solve_playlist, share the same pages instead of each
+# holding a copy, and loading it takes the same time regardless of its size.
+def load_pack() -> Pack | None:
+    import mmap
+    import transitions
+    global _loaded_pack
+    if _loaded_pack is None or _loaded_pack[0] != CACHE_PACK_FILE:
+        loaded = None
+        if pathlib.Path(CACHE_PACK_FILE).exists():
+            with open(CACHE_PACK_FILE, "rb") as f:
+                data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            # Packs of an older layout or of another model are ignored, cache.bin is used until repacked
+            if data[:4] == _PACK_MAGIC:
+                loaded = unpack(data)
+                if loaded.fingerprint != transitions.model_fingerprint():
+                    loaded = None
+        _loaded_pack = (CACHE_PACK_FILE, loaded)
+    return _loaded_pack[1]
+
+def find_packed(pack: Pack, i: int) -> list[Command] | None:
+    for key, encoded in packed_records_between(pack, i, i + 1):
+        return decode_solution(encoded)
     return None
 
+# Same as records_in_file_between but from the pack
+def packed_records_between(pack: Pack, low_index: int, high_index: int) -> list[tuple[int, int]]:
+    import bisect
+    records = []
+    for _, index, key, encoded in packed_records_from(pack, max(0, bisect.bisect_right(pack.first_indices, low_index) - 1)):
+        if index >= high_index:
+            break
+        if index >= low_index:
+            records.append((key, encoded))
+    return records
+
+# Same as records_of_many but from the pack
+def packed_records_of_many(pack: Pack, bases: list[int]) -> list[list[tuple[int, int]]]:
+    import bisect
+    records_of_bases = []
+    records = packed_records_from(pack, 0)
+    record = next(records, None)
+    for base in bases:
+        if records_of_bases and base == previous:
+            records_of_bases.append(records_of_bases[-1])
+            continue
+        if record is not None:
+            block = bisect.bisect_right(pack.first_indices, base, lo=record[0]) - 1
+            if block > record[0]:
+                records = packed_records_from(pack, block)
+                record = next(records, None)
+        while record is not None and record[1] < base:
+            record = next(records, None)
+        records_of_base = []
+        while record is not None and record[1] < base + 8:
+            records_of_base.append((record[2], record[3]))
+            record = next(records, None)
+        records_of_bases.append(records_of_base)
+        previous = base
+    return records_of_bases
+
+# The records of the pack from the start of the given block on as (block, state
+# combination, key, encoded solution)
+def packed_records_from(pack: Pack, block: int):
+    stream = pack.stream
+    while block < len(pack.first_indices):
+        position = pack.offsets[block]
+        index = pack.first_indices[block]
+        for n in range(min(PACK_BLOCK_SIZE, pack.record_count - block * PACK_BLOCK_SIZE)):
+            explicit = True
+            if n > 0:
+                difference, position = _read_varint(stream, position)
+                index += (difference >> 1) + 1
+                explicit = difference & 1
+            solution_id, position = _read_varint(stream, position)
+            if explicit:
+                variants = stream[position]
+                position += 1
+            else:
+                variants = _implied_variants(index)
+            yield block, index, variants << VARIANT_MASK_SHIFT | index, pack.solutions[solution_id]
+        block += 1
+
+# The byte of the variants of the most common record of the state combination:
+# special records are for their state combination only, and the records that
+# weren't regrouped with others are for their own variant
+def _implied_variants(index: int) -> int:
+    return 0 if index >= SPECIAL_INDEX_OFFSET else 1 << index % 8
+
+def _write_varint(stream: bytearray, value: int):
+    while value >= 0x80:
+        stream.append(value & 0x7F | 0x80)
+        value >>= 7
+    stream.append(value)
+
+def _read_varint(stream: bytes | memoryview, position: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = stream[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def read_records() -> list[tuple[int, int]]:
+    with open(CACHE_FILE, "rb") as f:
+        data = f.read()
+    return [(int.from_bytes(data[i:i+4], byteorder='big'), int.from_bytes(data[i+4:i+8], byteorder='big'))
+            for i in range(0, len(data), 8)]
+
+# Replaces the pack atomically as other processes may have the old one mapped
+def write_pack():
+    import os
+    global _loaded_pack
+    with open(CACHE_PACK_FILE + ".tmp", "wb") as f:
+        f.write(pack(read_records()))
+    os.replace(CACHE_PACK_FILE + ".tmp", CACHE_PACK_FILE)
+    _loaded_pack = None
+
 def encode_state_combination(decoded_initial_state: State, target_state: str) -> int:
     backled_mode_i = decoded_initial_state.backled_mode
     frontled_mode_i = decoded_initial_state.frontled_mode
     potled_mode_i = decoded_initial_state.potled_mode
-    target_i = TARGET_STATES.index(target_state)
+    target_i = _TARGET_INDICES[target_state]
     backled_status_i = decoded_initial_state.backled_on
     frontled_status_i = decoded_initial_state.frontled_on
     potled_status_i = decoded_initial_state.potled_on
@@ -107,6 +557,42 @@ def encode_state_combination(decoded_initial_state: State, target_state: str) ->
 
     return index
 
+def decode_state_combination(index: int) -> tuple[State, str]:
+    state = State()
+    index, state.potled_on    = divmod(index, 2)
+    index, state.frontled_on  = divmod(index, 2)
+    index, state.backled_on   = divmod(index, 2)
+    index, target_i           = divmod(index, len(TARGET_STATES))
+    index, state.potled_mode   = divmod(index, len(POTLED_MODES))
+    index, state.frontled_mode = divmod(index, len(FRONTLED_MODES))
+    state.backled_mode = index
+    return state, TARGET_STATES[target_i]
+
+def encode_special_combination(decoded_initial_state: State, target_state: str) -> int:
+    index = 0
+    index = decoded_initial_state.backled_mode    + index * len(BACKLED_MODES)
+    index = decoded_initial_state.frontled_mode   + index * len(FRONTLED_MODES)
+    index = decoded_initial_state.potled_mode     + index * len(POTLED_MODES)
+    index = _SPECIAL_TARGET_INDICES[target_state] + index * len(SPECIAL_TARGET_STATES)
+    index = decoded_initial_state.backled_on      + index * 2
+    index = decoded_initial_state.frontled_on     + index * 2
+    index = decoded_initial_state.potled_on       + index * 2
+    index = decoded_initial_state.frontled_paused + index * 2
+
+    return SPECIAL_INDEX_OFFSET + index
+
+def decode_special_combination(index: int) -> tuple[State, str]:
+    state = State()
+    index, state.frontled_paused = divmod(index - SPECIAL_INDEX_OFFSET, 2)
+    index, state.potled_on       = divmod(index, 2)
+    index, state.frontled_on     = divmod(index, 2)
+    index, state.backled_on      = divmod(index, 2)
+    index, target_i              = divmod(index, len(SPECIAL_TARGET_STATES))
+    index, state.potled_mode     = divmod(index, len(POTLED_MODES))
+    index, state.frontled_mode   = divmod(index, len(FRONTLED_MODES))
+    state.backled_mode = index
+    return state, SPECIAL_TARGET_STATES[target_i]
+
 def encode_solution(solution: list[Command]) -> int:
     # reversed because the last steps in the longest known solutions are small in value making the encoded solution fit 4 bytes:
     reversed = solution[::-1]
@@ -121,10 +607,251 @@ def decode_solution(encoded: int) -> list[Command]:
     # reversed; see above.
     return solution[::-1]
 
+# The states between which the cached solution for a special target goes
+def special_endpoints(decoded_initial_state: State, target_state: str) -> tuple[State, State]:
+    if target_state == "potled calibrate":
+        return perform_command(decoded_initial_state, POTLED_CALIBRATION_PHASE[0]), decoded_initial_state
+    return decoded_initial_state, solver.read_state(decoded_initial_state, [target_state])
+
+def cache_special_targets(only_backled_modes: list[str] = BACKLED_MODES):
+    import graph
+    import time
+
+    if graph.load() is None:
+        print("Build graph.bin of the current model first by running graph.py")
+        return
+
+    lines = []
+    too_long = 0
+    for backled_mode in only_backled_modes:
+        start = time.time()
+        for frontled_mode in FRONTLED_MODES:
+            for potled_mode in POTLED_MODES:
+                for target_state in SPECIAL_TARGET_STATES:
+                    solutions: list[list[Command]] = []
+                    for backled_status in ["backled off", "backled on"]:
+                        for frontled_status in ["frontled off", "frontled on"]:
+                            for potled_status in ["potled off", "potled on"]:
+                                for pause_status in ["frontled unpaused", "frontled paused"]:
+                                    initial_states = [backled_mode, frontled_mode, potled_mode, backled_status, frontled_status, potled_status, pause_status]
+                                    decoded_initial_state = solver.read_state(State(), initial_states)
+                                    if not is_state_setting_effective(decoded_initial_state, target_state):
+                                        continue
+                                    state, endstate = special_endpoints(decoded_initial_state, target_state)
+                                    # The graph makes the search exhaustive, solutions of the neighbouring combinations only bound it
+                                    known_solutions = [s for s in solutions if solver.is_solution(s, state, endstate)]
+                                    known_solution = min(known_solutions, key=len) if known_solutions else None
+                                    solution = solver.solve_internal_with_report(state, endstate, time.monotonic() + 60, known_solution).commands
+                                    assert solution is not None, "No solution for {} -> {}".format(initial_states, target_state)
+                                    solutions.append(solution)
+                                    encoded = encode_solution(solution)
+                                    if encoded >= 1 << 32:
+                                        too_long += 1 # left for solver.handle_special_case or a search
+                                        continue
+                                    lines.append((encode_special_combination(decoded_initial_state, target_state), encoded))
+        print("All special states handled for {} in {} s (to be cached so far: {}, too long to cache: {})".format(backled_mode, time.time() - start, len(lines), too_long))
+
+    # Any earlier special records are replaced
+    merge_records(lines, lambda index: index >= SPECIAL_INDEX_OFFSET
+                  and decode_backled_mode_of_special(index) in only_backled_modes)
+
+# Adds the (state combination, encoded solution) records to cache.bin keeping it
+# sorted. Earlier records for the same state combinations are replaced, as are
+# the ones for which drop returns True. With regroup_added the on/off variants
+# of the added state combinations are regrouped (see regroup), with
+# regroup_all every one.
+def merge_records(lines: list[tuple[int, int]], drop=lambda index: False, regroup_added: bool = False,
+                  regroup_all: bool = False):
+    import os
+    records: dict[int, int] = {} # state combination -> record as an int of 8 bytes
+    with open(CACHE_FILE, "rb") as f:
+        while data := f.read(8):
+            index = split_key(int.from_bytes(data[:4], byteorder='big'))[0]
+            if not drop(index):
+                records[index] = int.from_bytes(data, byteorder='big')
+    regrouped = records if regroup_all else [index for index, _ in lines] if regroup_added else []
+    bases = {index - index % 8 for index in regrouped if index < SPECIAL_INDEX_OFFSET}
+    solutions: dict[int, dict[int, int]] = {base: {} for base in bases} # base -> variant -> encoded solution
+    for index in sorted(records):
+        if index - index % 8 in bases:
+            key, encoded = divmod(records.pop(index), 1 << 32)
+            for variant in range(8):
+                if split_key(key)[1] >> variant & 1:
+                    solutions[index - index % 8][variant] = encoded
+    for index, encoded in lines:
+        if index - index % 8 in bases:
+            solutions[index - index % 8][index % 8] = encoded
+        else:
+            records[index] = index << 32 | encoded
+    for base in bases:
+        for key, encoded in regroup(base, solutions[base]):
+            records[split_key(key)[0]] = key << 32 | encoded
+    with open(CACHE_FILE + ".tmp", "wb") as f:
+        f.write(b"".join(records[index].to_bytes(8, byteorder='big') for index in sorted(records)))
+    os.replace(CACHE_FILE + ".tmp", CACHE_FILE)
+    if pathlib.Path(CACHE_PACK_FILE).exists():
+        write_pack()
+
+# Groups the on/off variants of the state combination by their solution so that
+# one record serves every variant it works for and a lookup takes a single
+# probe (see find_variant). Like the cache was looked up before, each variant
+# uses the solution of the first of the variants with the devices turned off
+# one by one that works for it, its own solution last (see _toggled_variants).
+# Takes the solutions of the variants at hand and returns the records, the
+# state combination of each being its lowest variant.
+def regroup(base: int, solutions: dict[int, int]) -> list[tuple[int, int]]:
+    import transitions
+
+    groups: dict[int, int] = {} # encoded solution -> variants
+    for variant in range(8):
+        state, target_state = decode_state_combination(base + variant)
+        if not is_state_setting_effective(state, target_state):
+            continue
+        endstate = solver.read_state(state, [target_state])
+        for other in _toggled_variants(variant, target_state):
+            if other in solutions and transitions.replays_to(decode_solution(solutions[other]), state, endstate):
+                groups[solutions[other]] = groups.get(solutions[other], 0) | 1 << variant
+                break
+    return sorted((variants << VARIANT_MASK_SHIFT | base + (variants & -variants).bit_length() - 1, encoded)
+                  for encoded, variants in groups.items())
+
+# Regroups every record of cache.bin, e.g. ones of a cache built before regroup
+def canonicalize():
+    merge_records([], regroup_all=True)
+
+# The variants whose solutions may be used for the variant, in order of preference
+def _toggled_variants(variant: int, target_state: str) -> list[int]:
+    toggled = []
+    if DEVICE_TOGGLING_OPTIMIZATION:
+        for bit, device in [(4, "backled"), (2, "frontled"), (1, "potled")]:
+            if variant & bit and target_state not in [device + " off", device + " on"]:
+                toggled += _toggled_variants(variant & ~bit, target_state)
+    return toggled + [variant]
+
+# Replays every cached solution against the current model, for every variant
+# it's for, and returns the state combinations of the records whose solution
+# no longer leads to the desired state. Each solution is replayed both through
+# the per-device tables that lookups use (see transitions.replays_to) and
+# through perform_command that the solver checks its plans with (see
+# solver.is_solution), as the two are separate models. With drop the stale
+# records are removed. The fingerprint of the model is stamped into
+# FINGERPRINT_FILE once the cache holds no stale records.
+def verify(drop: bool = False) -> list[int]:
+    import transitions
+
+    stale = []
+    solutions: dict[int, list[Command]] = {}
+    for key, encoded in read_records():
+        index, variants = split_key(key)
+        if index >= SPECIAL_INDEX_OFFSET:
+            decoded_initial_state, target_state = decode_special_combination(index)
+            endpoints = [special_endpoints(decoded_initial_state, target_state)]
+        else:
+            endpoints = []
+            for variant in range(8):
+                if variants >> variant & 1:
+                    state, target_state = decode_state_combination(index - index % 8 + variant)
+                    endpoints.append((state, solver.read_state(state, [target_state])))
+        if encoded not in solutions:
+            solutions[encoded] = decode_solution(encoded)
+        if not all(transitions.replays_to(solutions[encoded], state, endstate)
+                   and solver.is_solution(solutions[encoded], state, endstate) for state, endstate in endpoints):
+            stale.append(index)
+    if stale and drop:
+        stale_indices = set(stale)
+        merge_records([], lambda index: index in stale_indices)
+    if not stale or drop:
+        stamp_fingerprint()
+    return stale
+
+# Tells how the requests of the workload log (see main.read_workload_log) would
+# be answered by the cache, and of the misses, how many take a search at least
+# CACHE_SEARCH_DEPTH deep. Returns the amounts by outcome.
+def report(log_file: str) -> dict[str, int]:
+    from collections import Counter
+    import main
+
+    outcomes: Counter[str] = Counter()
+    for given_initial_state, given_desired_state, _ in main.read_workload_log(log_file):
+        try:
+            given_desired_state = convert_target_state(given_desired_state, main.separate(given_initial_state))
+            initial_state, desired_state = main.read_validated_input(given_initial_state, given_desired_state)
+        except main.InvalidParameters:
+            outcomes["invalid"] += 1
+            continue
+        decoded_initial_state = solver.read_state(State(), initial_state)
+        decoded_desired_state = solver.read_state(decoded_initial_state, desired_state)
+        if len(desired_state) > 1 or desired_state[0] not in TARGET_STATES + SPECIAL_TARGET_STATES \
+                + ["frontled paused", "frontled unpaused"]:
+            outcomes["not cacheable"] += 1
+        elif not is_state_setting_effective(decoded_initial_state, desired_state[0]) \
+                or decoded_desired_state == decoded_initial_state:
+            outcomes["no change"] += 1
+        elif get_cached_for_state(decoded_initial_state, desired_state[0]) is not None:
+            outcomes["hit"] += 1
+        elif solver.search_depth(decoded_initial_state, decoded_desired_state) >= CACHE_SEARCH_DEPTH:
+            outcomes["deep miss"] += 1
+        else:
+            outcomes["shallow miss"] += 1
+    return dict(outcomes)
+
+def decode_backled_mode_of_special(index: int) -> str:
+    return BACKLED_MODES[(index - SPECIAL_INDEX_OFFSET) // (len(FRONTLED_MODES) * len(POTLED_MODES) * len(SPECIAL_TARGET_STATES) * 16)]
+
 
 if __name__ == "__main__":
+    import sys
     import time
 
+    if "--pack" in sys.argv:
+        write_pack()
+        print("Packed {} records of {} bytes into {} bytes".format(len(read_records()), pathlib.Path(CACHE_FILE).stat().st_size,
+                                                                pathlib.Path(CACHE_PACK_FILE).stat().st_size))
+        sys.exit(0)
+
+    if "--verify" in sys.argv:
+        start = time.time()
+        stale = verify("--drop" in sys.argv)
+        for index in stale:
+            decoded_state, target_state = decode_special_combination(index) if index >= SPECIAL_INDEX_OFFSET \
+                else decode_state_combination(index)
+            print("Stale: {} -> {}".format(", ".join(solver.describe_state(decoded_state)), target_state))
+        print("Verified {} records in {} s: {} stale{}".format(len(read_records()) + (len(stale) if "--drop" in sys.argv else 0),
+                                                              time.time() - start, len(stale),
+                                                              ", dropped" if stale and "--drop" in sys.argv else ""))
+        sys.exit(0 if not stale or "--drop" in sys.argv else 1)
+
+    if "--canonicalize" in sys.argv:
+        records = len(read_records())
+        canonicalize()
+        print("Regrouped {} records into {}".format(records, len(read_records())))
+        sys.exit(0)
+
+    if "--warm" in sys.argv:
+        import os
+        os.nice(19) # this is background work
+        warm()
+        sys.exit(0)
+
+    if "--special" in sys.argv:
+        # Optionally limited to the given backled modes, e.g. --special "backled r" "backled r2"
+        cache_special_targets([arg for arg in sys.argv[1:] if arg in BACKLED_MODES] or BACKLED_MODES)
+        sys.exit(0)
+
+    if "--report" in sys.argv and sys.argv.index("--report") + 1 < len(sys.argv):
+        outcomes = report(sys.argv[sys.argv.index("--report") + 1])
+        total = sum(outcomes.values())
+        cacheable = sum(outcomes.get(outcome, 0) for outcome in ["hit", "deep miss", "shallow miss"])
+        for outcome in ["hit", "deep miss", "shallow miss", "no change", "not cacheable", "invalid"]:
+            print("{:>14}: {} ({:.1f} %)".format(outcome, outcomes.get(outcome, 0), 100 * outcomes.get(outcome, 0) / max(total, 1)))
+        print("Hit rate of the cacheable requests: {:.1f} %".format(100 * outcomes.get("hit", 0) / max(cacheable, 1)))
+        print("Hit rate excluding the shallow misses: {:.1f} %".format(
+            100 * outcomes.get("hit", 0) / max(outcomes.get("hit", 0) + outcomes.get("deep miss", 0), 1)))
+        sys.exit(0)
+
+    import heapq
+    full = "--full" in sys.argv
+    budgeted: list[tuple[tuple[int, int, int], int, int]] = [] # min-heap of (cost, state combination, encoded solution)
     i = 0 # all state combinations enumerated (Note: frontled pause state excluded; should always be [Command.FRONT_PLAYPAUSE])
     starting_index = 0
 
@@ -161,11 +888,19 @@ if __name__ == "__main__":
                                         break
 
                                 if solution is None:
-                                    st = time.time()
                                     solution = solver.solve_internal(decoded_initial_state, decoded_desired_state)
-                                    if time.time() - st > CACHE_SLOWER_THAN_MS/1000:
+                                    if not full and solution is not None \
+                                            and solver.search_depth(decoded_initial_state, decoded_desired_state) >= CACHE_SEARCH_DEPTH:
                                         cached_amount += 1
-                                        lines.append((i-1, encode_solution(solution))) # type: ignore  # assert will handle the hyphotetical None case
+                                        lines.append((i-1, encode_solution(solution)))
+                                if full and solution and encode_solution(list(solution)) < 1 << 32:
+                                    # the costliest solutions are kept: the deepest searches, then the longest solutions
+                                    cost = (solver.search_depth(decoded_initial_state, decoded_desired_state), len(solution), -i)
+                                    if len(budgeted) < CACHE_FULL_BUDGET_BYTES // 8:
+                                        heapq.heappush(budgeted, (cost, i-1, encode_solution(list(solution))))
+                                    else:
+                                        heapq.heappushpop(budgeted, (cost, i-1, encode_solution(list(solution))))
+                                    cached_amount = len(budgeted)
                                 assert solution != [], "Empty solution for {}, {}, {}, {}, {}, {} -> {}".format(backled_mode, frontled_mode, potled_mode, backled_status, frontled_status, potled_status, target_state)
                                 assert solution is not None, "No solution for {}, {}, {}, {}, {}, {} -> {}".format(backled_mode, frontled_mode, potled_mode, backled_status, frontled_status, potled_status, target_state)
                                 solutions.add(tuple(solution))
@@ -174,4 +909,11 @@ if __name__ == "__main__":
 
             with open(CACHE_FILE, "ab") as f:
                 for index, encoded in lines:
-                    f.write(index.to_bytes(4, byteorder='big') + encoded.to_bytes(4, byteorder='big'))
\ No newline at end of file
+                    f.write(index.to_bytes(4, byteorder='big') + encoded.to_bytes(4, byteorder='big'))
+
+    if full:
+        # Any earlier normal records are replaced
+        merge_records([(index, encoded) for _, index, encoded in budgeted], lambda index: index < SPECIAL_INDEX_OFFSET,
+                      regroup_added=True)
+    else:
+        canonicalize()
\ No newline at end of file
@@ -420,6 +420,11 @@ def potled_get_command_for(mode: int) -> Command:
         Command.FRONT_AUTO_POT_FLASH
     ][mode]
 
+# Calibrating the potled requires an absurd amount of RED-commands and as such
+# it's not encoded in the graph and has to be handled semi-manually: this is
+# followed by returning to the state before it.
+POTLED_CALIBRATION_PHASE = [Command.FRONT_DIY5_POT_R] * 17 # Yes, really this many.
+
 pos = 1
 pos = (BACKLED_ON              := pos) * (BACKLED_ON_LENGTH  := 2)  # on/off
 pos = (FRONTLED_ON             := pos) * (FRONTLED_ON_LENGTH := 2)  # on/off
@@ -552,6 +557,10 @@ def is_state_setting_effective(state: State, setting: str) -> bool:
             return state.frontled_on == 1 and state.frontled_mode == 24
         case "frontled diy6 rup" | "frontled diy6 rdown" | "frontled diy6 gup" | "frontled diy6 gdown" | "frontled diy6 bup" | "frontled diy6 bdown":
             return state.frontled_on == 1 and state.frontled_mode == 25
+        case "frontled paused":
+            return state.frontled_on == 1 and state.frontled_paused == 0
+        case "frontled unpaused":
+            return state.frontled_on == 1 and state.frontled_paused == 1
         case "frontled calibrate":
             return state.frontled_on == 1
         case "potled calibrate":
@@ -641,6 +650,21 @@ def read_state(initial_state: State, given_state: list[str]) -> State:
 
     return state
 
+# The inverse of read_state for the absolute part of the state: relative
+# changes and calibration are left out as those can't be told as an initial
+# state.
+def describe_state(state: State) -> list[str]:
+    description = [BACKLED_MODES[state.backled_mode], FRONTLED_MODES[state.frontled_mode], POTLED_MODES[state.potled_mode]]
+    if state.backled_on == 0:
+        description.append("backled off")
+    if state.frontled_on == 0:
+        description.append("frontled off")
+    if state.potled_on == 0:
+        description.append("potled off")
+    if state.frontled_paused == 1:
+        description.append("frontled paused")
+    return description
+
 def set_r(encoded, trit):
     return encoded - get_r(encoded) + trit
 
@@ -0,0 +1,288 @@
+"""
+Differential fuzzing of the faster ways of traversing the graph against the
+reference ones: perform_command for the transitions and a plain breadth-first
+search over perform_command for the solutions. Random states and series of
+commands are run through both, and any disagreement is shrunk to a minimal
+reproduction: as few commands as possible, and a state with as many fields at
+their defaults (see State) as possible.
+
+The cases are of three kinds:
+  successors: the successor of the state by each command from the per-device
+              tables (transitions.py), the successor memo, the spec (spec.py),
+              the applicability index and the edges of graph.bin
+  replay: whether replaying the commands reaches where perform_command does,
+          by transitions.replays_to and solver.is_solution
+  search: the solutions by solver.bfs, solver.bfs_parallel and graph.bfs (the
+          latter between absolute states only), which have to be valid and of
+          the least length up to MAX_STEPS_TO_CHECK like the solver searches
+One in FUZZ_SEARCH_EVERY cases is a search, as those are much slower. The
+states are either absolute ones or reached from one by a random walk, so that
+they are ones the devices can actually be in.
+
+Running this script fuzzes for FUZZ_SECONDS (--seconds N) from the given seed
+(--seed N) in the given amount of processes (--workers N, each with a seed of
+its own), and prints the amount of cases and the shrunk failures. The exit
+code tells whether any were found, for running it nightly.
+
+Note: the edges of graph.bin are only checked if it exists and is of the
+      current model (see graph.py).
+"""
+
+from configuration import *
+import graph
+import solver
+import spec
+import transitions
+
+# Time to fuzz for unless given, in seconds:
+FUZZ_SECONDS = 60
+# One in this many cases is a search:
+FUZZ_SEARCH_EVERY = 50
+# Length of the longest solution sought in search cases, as deep as the solver searches (see solver.py):
+FUZZ_SEARCH_LIMIT = solver.MAX_STEPS_TO_CHECK
+# Amount of worker processes of solver.bfs_parallel in search cases:
+FUZZ_PARALLEL_WORKERS = 2
+# Length of the longest series of commands in replay and search cases:
+FUZZ_WALK_LENGTH = 4
+# Length of the longest random walk from an absolute state to the states that aren't absolute:
+FUZZ_REACH_LENGTH = 12
+# Fuzzing stops after finding this many failures:
+FUZZ_MAX_FAILURES = 10
+
+# A failing case along with what disagreed
+@dataclasses.dataclass
+class Failure:
+    kind: str
+    state: int
+    commands: list[Command]
+    mismatch: str
+
+    def describe(self) -> str:
+        state = decode_state(self.state)
+        fields = ["{}={}".format(field.name, getattr(state, field.name)) for field in dataclasses.fields(State)
+                  if getattr(state, field.name) != getattr(_DEFAULT_STATE, field.name)]
+        return "{}: from State({}) with [{}]: {}".format(self.kind, ", ".join(fields),
+                                                        ", ".join(command.name for command in self.commands), self.mismatch)
+
+_DEFAULT_STATE = State()
+# The fields of State that are encoded, i.e. the ones shrinking can reset
+_ENCODED_FIELDS = [field.name for field in dataclasses.fields(State) if field.name != "potled_calibration"]
+
+# The reference successor of the state, None if the command is forbidden
+def reference_successor(state: int, command: Command) -> int | None:
+    decoded_state = decode_state(state)
+    new_state = perform_command(decoded_state, command)
+    return None if new_state is decoded_state else encode_state(new_state)
+
+def _device_tables_successor(state: int, command: Command) -> int | None:
+    decoded_state = decode_state(state)
+    successors = [transitions.device_transitions(device, transitions.device_values(device, decoded_state))[command.value]
+                  for device in transitions.DEVICES]
+    return None if None in successors else sum(successors)
+
+def _memo_successor(state: int, command: Command) -> int | None:
+    successor = transitions.successor(state, decode_state(state), command)
+    # The memo doesn't tell forbidden moves apart from ones that change nothing
+    return None if successor == state and reference_successor(state, command) is None else successor
+
+# The engines giving the successors that are compared against reference_successor
+SUCCESSOR_ENGINES = {
+    "device tables": _device_tables_successor,
+    "successor memo": _memo_successor,
+    "spec": lambda state, command: spec.load().successor(state, command.value),
+}
+
+def check_successors(state: int, commands: list[Command]) -> str | None:
+    decoded_state = decode_state(state)
+    mask = transitions.applicable_mask(decoded_state)
+    csr_graph = graph.load()
+    edges = dict(graph.neighbours(csr_graph, state)) if csr_graph is not None and graph.in_graph(state) else None
+    for command in commands:
+        expected = reference_successor(state, command)
+        for name, engine in SUCCESSOR_ENGINES.items():
+            actual = engine(state, command)
+            if actual != expected:
+                return "{} gives {} by {}, expected {}".format(name, actual, command.name, expected)
+        changes = expected is not None and expected != state
+        if bool(mask >> command.value & 1) != changes:
+            return "applicability index tells {} {}".format(
+                command.name, "changes nothing" if changes else "changes the state")
+        if edges is not None:
+            expected_edge = expected if changes and graph.in_graph(expected) else None
+            if edges.get(command.value) != expected_edge:
+                return "graph has edge {} by {}, expected {}".format(edges.get(command.value), command.name, expected_edge)
+    return None
+
+# Where performing the commands leads, forbidden ones changing nothing
+def walk(state: int, commands: list[Command]) -> int:
+    for command in commands:
+        successor = reference_successor(state, command)
+        if successor is not None:
+            state = successor
+    return state
+
+def check_replay(state: int, commands: list[Command]) -> str | None:
+    decoded_state = decode_state(state)
+    decoded_endstate = decode_state(walk(state, commands))
+    expected = solver.is_solution(commands, decoded_state, decoded_endstate)
+    actual = transitions.replays_to(commands, decoded_state, decoded_endstate)
+    if actual != expected:
+        return "replays_to tells {}, expected {}".format(actual, expected)
+    return None
+
+# Length of the shortest solution up to the given limit by a plain
+# breadth-first search over perform_command, None if there is none
+def reference_distance(state: int, endstate: int, limit: int) -> int | None:
+    if state == endstate:
+        return 0
+    visited = {state}
+    frontier = [state]
+    for depth in range(1, limit + 1):
+        next_frontier = []
+        for node in frontier:
+            for command in COMMANDS:
+                successor = reference_successor(node, command)
+                if successor is None or successor in visited:
+                    continue
+                if successor == endstate:
+                    return depth
+                visited.add(successor)
+                next_frontier.append(successor)
+        frontier = next_frontier
+    return None
+
+def check_search(state: int, commands: list[Command]) -> str | None:
+    endstate = walk(state, commands)
+    if state == endstate:
+        return None # nothing for the searches to agree on
+    expected = reference_distance(state, endstate, FUZZ_SEARCH_LIMIT)
+    decoded_state = decode_state(state)
+    decoded_endstate = decode_state(endstate)
+    csr_graph = graph.load()
+    searches = {
+        "solver.bfs": lambda: solver.bfs(decoded_state, decoded_endstate, FUZZ_SEARCH_LIMIT),
+        "solver.bfs_parallel": lambda: solver.bfs_parallel(decoded_state, decoded_endstate, FUZZ_SEARCH_LIMIT,
+                                                           FUZZ_PARALLEL_WORKERS),
+    }
+    if csr_graph is not None and graph.in_graph(state) and graph.in_graph(endstate):
+        searches["graph.bfs"] = lambda: graph.bfs(csr_graph, state, endstate, FUZZ_SEARCH_LIMIT)
+    for name, search in searches.items():
+        solution = search()
+        if solution is not None and not solver.is_solution(solution, decoded_state, decoded_endstate):
+            return "{} gives [{}] which is not a solution".format(name, ", ".join(c.name for c in solution))
+        if (None if solution is None else len(solution)) != expected:
+            return "{} gives a solution of length {}, expected {}".format(
+                name, None if solution is None else len(solution), expected)
+    return None
+
+CHECKS = {"successors": check_successors, "replay": check_replay, "search": check_search}
+
+# Shrinks the failing case: drops the commands and resets the fields of the
+# state to their defaults one at a time for as long as it keeps failing
+def shrink(failure: Failure) -> Failure:
+    check = CHECKS[failure.kind]
+    shrunk = True
+    while shrunk:
+        shrunk = False
+        for i in range(len(failure.commands)):
+            commands = failure.commands[:i] + failure.commands[i + 1:]
+            if commands and (mismatch := check(failure.state, commands)) is not None:
+                failure = Failure(failure.kind, failure.state, commands, mismatch)
+                shrunk = True
+                break
+        decoded_state = decode_state(failure.state)
+        for field in _ENCODED_FIELDS:
+            if getattr(decoded_state, field) == getattr(_DEFAULT_STATE, field):
+                continue
+            state = encode_state(dataclasses.replace(decoded_state, **{field: getattr(_DEFAULT_STATE, field)}))
+            if (mismatch := check(state, failure.commands)) is not None:
+                failure = Failure(failure.kind, state, failure.commands, mismatch)
+                shrunk = True
+                break
+    return failure
+
+# An absolute state (see graph.py), or one reached from such by a random walk
+def random_state(generator, absolute: bool) -> int:
+    state = generator.randrange(BACKLED_REL_BRIGHTNESS) \
+        + generator.randrange(FRONTLED_CALIBRATION_LENGTH) * FRONTLED_CALIBRATION
+    if not absolute:
+        state = walk(state, [generator.choice(list(COMMANDS)) for _ in range(generator.randint(1, FUZZ_REACH_LENGTH))])
+    return state
+
+# A random series of commands, with changing_only only ones that change the state
+def random_commands(generator, state: int, changing_only: bool) -> list[Command]:
+    commands = []
+    for _ in range(generator.randint(1, FUZZ_WALK_LENGTH)):
+        choices = list(COMMANDS)
+        if changing_only:
+            choices = [command for command in choices if reference_successor(state, command) not in [None, state]]
+            if not choices:
+                break
+        commands.append(generator.choice(choices))
+        state = walk(state, commands[-1:])
+    return commands
+
+# Runs cases until the time runs out, the given amount of cases is done or
+# FUZZ_MAX_FAILURES are found. Returns the amount of cases of each kind and the
+# shrunk failures.
+def fuzz(seconds: float = FUZZ_SECONDS, seed: int = 0, cases: int | None = None) -> tuple[dict[str, int], list[Failure]]:
+    import random
+    import time
+
+    generator = random.Random(seed)
+    deadline = time.monotonic() + seconds
+    counts = {kind: 0 for kind in CHECKS}
+    failures = []
+    n = 0
+    while time.monotonic() < deadline and (cases is None or n < cases) and len(failures) < FUZZ_MAX_FAILURES:
+        if n % FUZZ_SEARCH_EVERY == FUZZ_SEARCH_EVERY - 1:
+            kind = "search"
+            state = random_state(generator, n // FUZZ_SEARCH_EVERY % 2 == 0)
+            commands = random_commands(generator, state, True)
+        elif n % 2 == 0:
+            kind = "successors"
+            state = random_state(generator, n % 4 == 0)
+            commands = list(COMMANDS)
+        else:
+            kind = "replay"
+            state = random_state(generator, n % 4 == 1)
+            commands = random_commands(generator, state, n % 3 == 0)
+        n += 1
+        counts[kind] += 1
+        if commands and (mismatch := CHECKS[kind](state, commands)) is not None:
+            failures.append(shrink(Failure(kind, state, commands, mismatch)))
+    return counts, failures
+
+def _fuzz_worker(arguments: tuple[float, int]) -> tuple[dict[str, int], list[Failure]]:
+    return fuzz(*arguments)
+
+
+if __name__ == "__main__":
+    import sys
+
+    seconds = FUZZ_SECONDS
+    seed = 0
+    workers = 1
+    for i, argument in enumerate(sys.argv[:-1]):
+        if argument == "--seconds":
+            seconds = float(sys.argv[i + 1])
+        elif argument == "--seed":
+            seed = int(sys.argv[i + 1])
+        elif argument == "--workers":
+            workers = int(sys.argv[i + 1])
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_fuzz_worker, [(seconds, seed + i) for i in range(workers)]))
+    else:
+        results = [fuzz(seconds, seed)]
+
+    counts = {kind: sum(result[0][kind] for result in results) for kind in CHECKS}
+    failures = [failure for result in results for failure in result[1]]
+    print("Cases: " + ", ".join("{} {}".format(kind, count) for kind, count in counts.items()))
+    print("Transitions compared: {}".format(counts["successors"] * len(COMMANDS)))
+    for failure in failures:
+        print(failure.describe())
+    print("{} failures".format(len(failures)))
+    sys.exit(1 if failures else 0)
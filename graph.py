@@ -0,0 +1,267 @@
+"""
+The graph of absolute states stored in compressed sparse row form in graph.bin.
+Absolute states are the ones without relative changes or calibration, i.e.
+the ones a device can be told to be in. Their encoded values (see
+encode_state) are 0 ... NODE_COUNT - 1, so the encoded value is also the
+index of the node. The edges leaving node i are targets[offsets[i]:offsets[i+1]]
+taken with the commands at the same indices, in ascending order of command
+values. The arrays are memory-mapped from the file so searching over the graph
+only reads plain arrays instead of calling perform_command.
+
+Calibration of the frontled only changes by CALIBRATING_COMMANDS while the
+frontled is off, and nothing else depends on it. Thus the states with any
+calibration have the same edges as the absolute state with the calibration
+left out, apart from the calibrating ones, which are found while searching.
+Such states are in the graph too (see in_graph) without growing the file.
+
+Running this script builds graph.bin, which takes a few seconds. Run it with
+--stats to see its size and the most distant states from a sample of states
+(--sample N, 3 by default).
+
+Note: With AVOID_CHANGING_RELATIVE_STATE_NEEDLESSLY a relative change can't be
+      undone, so no path between states in the graph goes through a relative
+      state. The distances in the graph are those of the whole graph.
+
+Also note: graph.bin is only valid for the graph it was built from. It's
+           stamped with the fingerprint of the model (see
+           transitions.model_fingerprint) and ignored once perform_command or
+           COMMANDS changes, the searches falling back to solver.bfs until
+           it's rebuilt.
+"""
+
+from collections import OrderedDict
+from configuration import *
+import pathlib
+import transitions
+
+# Binary file to store the graph:
+GRAPH_FILE = pathlib.Path(__file__).parent.absolute().as_posix() + "/graph.bin"
+
+NODE_COUNT = BACKLED_REL_BRIGHTNESS
+
+CALIBRATING_COMMANDS = [command for command in COMMANDS
+                        if "frontled_calibration" in transitions.command_footprint(command)[1]]
+
+# header: model fingerprint 8 bytes, node count 8 bytes, edge count 8 bytes,
+# followed by offsets (8 bytes each), targets (4 bytes each) and commands
+# (1 byte each) in native byte order
+_HEADER_SIZE = 24
+
+@dataclasses.dataclass
+class Graph:
+    offsets: memoryview
+    targets: memoryview
+    commands: memoryview
+
+def build() -> Graph:
+    from array import array
+    if not AVOID_CHANGING_RELATIVE_STATE_NEEDLESSLY:
+        raise ValueError("Paths between absolute states may go through relative ones")
+    offsets = array('q', [0])
+    targets = array('i')
+    commands = array('B')
+    for node in range(NODE_COUNT):
+        state = decode_state(node)
+        tables = [transitions.device_transitions(device, transitions.device_values(device, state))
+                  for device in transitions.DEVICES]
+        for command, successors in enumerate(zip(*tables)):
+            if None in successors:
+                continue # forbidden on some device
+            successor = sum(successors)
+            if successor != node and successor < NODE_COUNT:
+                targets.append(successor)
+                commands.append(command)
+        offsets.append(len(targets))
+    return Graph(memoryview(offsets), memoryview(targets), memoryview(commands))
+
+# Replaces the file atomically as other processes may have the old one mapped
+def save(graph: Graph, file: str = GRAPH_FILE):
+    import os
+    with open(file + ".tmp", "wb") as f:
+        f.write(transitions.model_fingerprint())
+        f.write((len(graph.offsets) - 1).to_bytes(8, byteorder='little'))
+        f.write(len(graph.targets).to_bytes(8, byteorder='little'))
+        f.write(graph.offsets)
+        f.write(graph.targets)
+        f.write(graph.commands)
+    os.replace(file + ".tmp", file)
+
+_loaded: dict[str, Graph | None] = {}
+
+# None if the file doesn't exist or is of another model (or an older layout)
+def load(file: str = GRAPH_FILE) -> Graph | None:
+    import mmap
+    if file not in _loaded:
+        if not pathlib.Path(file).exists():
+            return None
+        with open(file, "rb") as f:
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        if data[:8] != transitions.model_fingerprint():
+            _loaded[file] = None
+            return None
+        node_count = int.from_bytes(data[8:16], byteorder='little')
+        edge_count = int.from_bytes(data[16:24], byteorder='little')
+        targets_start = _HEADER_SIZE + (node_count + 1) * 8
+        commands_start = targets_start + edge_count * 4
+        _loaded[file] = Graph(data[_HEADER_SIZE:targets_start].cast('q'),
+                              data[targets_start:commands_start].cast('i'),
+                              data[commands_start:commands_start + edge_count])
+    return _loaded[file]
+
+# Whether the encoded state has no relative changes
+def in_graph(state: int) -> bool:
+    return 0 <= state and state % FRONTLED_CALIBRATION < NODE_COUNT
+
+# (command value, encoded successor) pairs for the commands that change the
+# given state within the graph
+def neighbours(graph: Graph, state: int):
+    node = state % FRONTLED_CALIBRATION
+    calibration = state - node
+    for edge in range(graph.offsets[node], graph.offsets[node + 1]):
+        yield graph.commands[edge], graph.targets[edge] + calibration
+    if node // FRONTLED_ON % FRONTLED_ON_LENGTH == 0:
+        decoded_state = decode_state(state)
+        for command in CALIBRATING_COMMANDS:
+            successor = transitions.successor(state, decoded_state, command)
+            if successor != state and in_graph(successor):
+                yield command.value, successor
+
+# Amount of search trees to keep for reuse (see bfs):
+SEARCH_TREES_TO_KEEP = 8
+# Upper bound for the amount of nodes in the kept search trees altogether:
+SEARCH_TREE_NODES = 1 << 21
+
+# The part of the breadth-first search tree from a state explored so far: the
+# nodes of the first depth layers are expanded, as are the first position
+# nodes of the frontier, i.e. layer depth. Their successors are in next_frontier.
+@dataclasses.dataclass
+class SearchTree:
+    # node -> (parent node, command value)
+    parents: dict[int, tuple[int, int]]
+    frontier: list[int]
+    next_frontier: list[int] = dataclasses.field(default_factory=list)
+    position: int = 0
+    depth: int = 0
+
+# The search trees of the most recent sources, least recently used first
+_search_trees: OrderedDict[tuple[int, int], SearchTree] = OrderedDict()
+
+# Breadth-first search over the graph. Like solver.bfs only solutions shorter
+# than limit + 1 are sought. The search tree is kept for SEARCH_TREES_TO_KEEP
+# most recent sources, and the next search from the same source continues from
+# where it left off: queries for other targets from the same state, e.g. trying
+# several modes in a row, mostly only check whether the target is already in
+# the tree.
+def bfs(graph: Graph, state: int, endstate: int, limit: int, deadline: float | None = None) -> list[Command] | None:
+    if state == endstate:
+        return []
+    key = (id(graph), state)
+    tree = _search_trees.pop(key, None) or SearchTree({state: (-1, 0)}, [state])
+    _search_trees[key] = tree
+    try:
+        if endstate not in tree.parents:
+            _grow(graph, tree, endstate, limit, deadline)
+    finally:
+        _evict_search_trees()
+    if endstate not in tree.parents:
+        return None
+    path = _trace_path(tree.parents, endstate)
+    return path if len(path) <= limit else None
+
+# Expands the tree until the endstate is found or the layers up to limit are
+# expanded. Each node is expanded as a whole so that the tree stays complete.
+def _grow(graph: Graph, tree: SearchTree, endstate: int, limit: int, deadline: float | None):
+    import time
+    parents = tree.parents
+    while tree.depth < limit and tree.frontier:
+        frontier, next_frontier = tree.frontier, tree.next_frontier
+        while tree.position < len(frontier):
+            if deadline is not None and time.monotonic() > deadline:
+                from solver import DeadlineExceeded
+                raise DeadlineExceeded(tree.depth)
+            node = frontier[tree.position]
+            for command, target in neighbours(graph, node):
+                if target not in parents:
+                    parents[target] = (node, command)
+                    next_frontier.append(target)
+            tree.position += 1
+            if endstate in parents:
+                return
+        tree.frontier, tree.next_frontier, tree.position = next_frontier, [], 0
+        tree.depth += 1
+
+def _evict_search_trees():
+    nodes = sum(len(tree.parents) for tree in _search_trees.values())
+    while _search_trees and (len(_search_trees) > SEARCH_TREES_TO_KEEP or nodes > SEARCH_TREE_NODES):
+        _, tree = _search_trees.popitem(last=False)
+        nodes -= len(tree.parents)
+
+def _trace_path(parents: dict[int, tuple[int, int]], node: int) -> list[Command]:
+    path = []
+    while (parent := parents[node])[0] >= 0:
+        node, command = parent
+        path.append(Command(command))
+    return path[::-1]
+
+# Distances from the given state to the states with the same calibration, 255
+# for unreachable ones. Paths may go through other calibrations.
+def distances_from(graph: Graph, state: int) -> bytearray:
+    offsets, targets = graph.offsets, graph.targets
+    # distances indexed by calibration * NODE_COUNT + node
+    distances = bytearray(b'\xff') * (NODE_COUNT * FRONTLED_CALIBRATION_LENGTH)
+    calibration, node = divmod(state, FRONTLED_CALIBRATION)
+    distances[calibration * NODE_COUNT + node] = 0
+    frontier = [(calibration, node)]
+    depth = 0
+    while frontier:
+        depth += 1
+        next_frontier = []
+        for calibration, node in frontier:
+            layer = calibration * NODE_COUNT
+            for edge in range(offsets[node], offsets[node + 1]):
+                target = targets[edge]
+                if distances[layer + target] == 255:
+                    distances[layer + target] = depth
+                    next_frontier.append((calibration, target))
+            if node // FRONTLED_ON % FRONTLED_ON_LENGTH == 0:
+                for _, target in neighbours(graph, calibration * FRONTLED_CALIBRATION + node):
+                    target_calibration, target_node = divmod(target, FRONTLED_CALIBRATION)
+                    if target_calibration != calibration and distances[target_calibration * NODE_COUNT + target_node] == 255:
+                        distances[target_calibration * NODE_COUNT + target_node] = depth
+                        next_frontier.append((target_calibration, target_node))
+        frontier = next_frontier
+    layer = state // FRONTLED_CALIBRATION * NODE_COUNT
+    return distances[layer:layer + NODE_COUNT]
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+
+    if "--stats" in sys.argv:
+        graph = load()
+        if graph is None:
+            print("Build the graph first by running graph.py")
+            sys.exit(1)
+        sample = 3
+        if "--sample" in sys.argv and sys.argv.index("--sample") + 1 < len(sys.argv):
+            sample = int(sys.argv[sys.argv.index("--sample") + 1])
+        print("{} states, {} edges ({:.1f} per state)".format(NODE_COUNT, len(graph.targets), len(graph.targets) / NODE_COUNT))
+        hardest = (0, 0, 0)
+        unreachable = 0
+        for source in random.sample(range(NODE_COUNT), sample):
+            distances = distances_from(graph, source)
+            unreachable += distances.count(255)
+            distance = max(d for d in distances if d != 255)
+            if distance > hardest[0]:
+                hardest = (distance, source, distances.index(distance))
+        distance, source, target = hardest
+        print("Most distant states found: {} steps from {} to {}".format(
+            distance, ", ".join(describe_state(decode_state(source))), ", ".join(describe_state(decode_state(target)))))
+        print("Unreachable pairs found: {}".format(unreachable))
+    else:
+        start = time.time()
+        graph = build()
+        save(graph)
+        print("Built graph of {} states and {} edges in {} s".format(NODE_COUNT, len(graph.targets), time.time() - start))
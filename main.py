@@ -15,6 +15,8 @@ Also note: The solver can be slow for unfortunate cases (see solver.py). Use
 Additional optional arguments:
 --machine-readable: Only output the solution as commands line by line
 --use-cache:        Seeks solutions stored in cache.bin (see cache.py)
+--use-store:        Seeks solutions found earlier from store.sqlite3 and stores
+                    the ones found now (see store.py)
 --avoid-overwhelm:  In output suggest delays that may prevent device overwhelm
                     from unexpected amount of consecutive commands. This is
                     expressed as *Delay*.
@@ -24,6 +26,16 @@ Additional optional arguments:
                     subsequent commands in the series. However the only part
                     this script implements is to suggest *Await repeats*
                     appropriately.
+--workers N:        Split the search among N processes (see solver.py).
+--deadline-ms N:    Return the best solution found within N milliseconds. The
+                    output tells if it's not proven to be the shortest.
+--fastest:          Output the solution that is the fastest to execute instead
+                    of the shortest, with the delays needed between the
+                    commands expressed as *Delay N ms* (see timing.py).
+--playlist:         Take any number of desired states after the initial state
+                    and output a solution for reaching each of them in turn,
+                    separated by an empty line. All of them are solved for at
+                    once (concurrently with --workers).
 """
 
 import configuration
@@ -37,10 +49,53 @@ def read_input(arg1: str, arg2: str) -> tuple[list[str], list[str]]:
 def separate(str: str) -> list[str]:
     return [x.strip() for x in str.split(',')]
 
-def solve_command_series(given_initial_state: str, given_desired_state: str, use_cache: bool = False) -> list[configuration.Command] | None:
-    import validation as verify
+def solve_command_series(given_initial_state: str, given_desired_state: str, use_cache: bool = False,
+                         deadline_ms: int | None = None, use_store: bool = False) -> list[configuration.Command] | None:
+    return solve_command_series_with_report(given_initial_state, given_desired_state, use_cache, deadline_ms,
+                                            use_store).commands
+
+def solve_command_series_with_report(given_initial_state: str, given_desired_state: str, use_cache: bool = False,
+                                     deadline_ms: int | None = None, use_store: bool = False):
     import solver
 
+    initial_state, desired_state = read_validated_input(given_initial_state, given_desired_state)
+
+    return solver.solve_with_report(initial_state, desired_state, use_cache, deadline_ms, use_store)
+
+def solve_fastest(given_initial_state: str, given_desired_state: str, use_cache: bool = False,
+                  deadline_ms: int | None = None, use_store: bool = False):
+    import solver
+
+    initial_state, desired_state = read_validated_input(given_initial_state, given_desired_state)
+
+    return solver.solve_fastest(initial_state, desired_state, use_cache, deadline_ms, use_store)
+
+# Solves each transition of a playlist of desired states (see read_playlist)
+def solve_playlist(given_initial_state: str, given_desired_states: list[str], use_cache: bool = False,
+                   deadline_ms: int | None = None, use_store: bool = False) -> list:
+    import solver
+
+    return solver.solve_playlist(read_playlist(given_initial_state, given_desired_states), use_cache, deadline_ms,
+                                 use_store)
+
+# The transitions of a playlist as (initial state, desired state) pairs: the
+# first one from the given initial state and each after that from where the
+# previous one left off. The desired states are converted and validated like a
+# single desired state would be.
+def read_playlist(given_initial_state: str, given_desired_states: list[str]) -> list[tuple[list[str], list[str]]]:
+    transitions = []
+    state = separate(given_initial_state)
+    for given_desired_state in given_desired_states:
+        given_desired_state = configuration.convert_target_state(given_desired_state, state)
+        initial_state, desired_state = read_validated_input(", ".join(state), given_desired_state)
+        transitions.append((initial_state, desired_state))
+        decoded_initial_state = configuration.read_state(configuration.State(), initial_state)
+        state = configuration.describe_state(configuration.read_state(decoded_initial_state, desired_state))
+    return transitions
+
+def read_validated_input(given_initial_state: str, given_desired_state: str) -> tuple[list[str], list[str]]:
+    import validation as verify
+
     initial_state, desired_state = read_input(given_initial_state, given_desired_state)
 
     if not verify.is_valid_state(initial_state):
@@ -56,56 +111,46 @@ def solve_command_series(given_initial_state: str, given_desired_state: str, use
     if not verify.no_opposites_in_relative_states(desired_state):
         raise InvalidParameters("Simultaneous opposite states not allowed")
 
-    return solver.solve(initial_state, desired_state, use_cache)
+    return initial_state, desired_state
 
-AWAIT_REPEATS = "*Await repeats*"
-DELAY = "*Delay*"
+# Reads a workload log: one request per line as a JSON object with the initial
+# and desired states as given to this script, and optionally the flags, e.g.
+# {"initial": "backled r, frontled g, potled b", "desired": "frontled b", "flags": ["--use-cache"]}
+def read_workload_log(file: str) -> list[tuple[str, str, list[str]]]:
+    import json
 
-if __name__ == "__main__":
-    import sys
+    requests = []
+    with open(file) as f:
+        for line in f:
+            if line.strip():
+                request = json.loads(line)
+                requests.append((request["initial"], request["desired"], request.get("flags", [])))
+    return requests
 
-    positional = 0
-    machine_readable_output = False
-    use_cache = False
-    mark_delays_for_avoiding_overwhelm = False
-    mark_opportunity_for_awaiting_repeat_inputs = False
-    initial_state = ""
-    desired_state = ""
-    for i in range(1, len(sys.argv)):
-        if sys.argv[i] == "--machine-readable":
-            machine_readable_output = True
-        elif sys.argv[i] == "--use-cache":
-            use_cache = True
-        elif sys.argv[i] == "--avoid-overwhelm":
-            mark_delays_for_avoiding_overwhelm = True
-        elif sys.argv[i] == "--await-repeats":
-            mark_opportunity_for_awaiting_repeat_inputs = True
-        else:
-            if positional == 0:
-                initial_state = sys.argv[i]
-            elif positional == 1:
-                desired_state = sys.argv[i]
-            positional += 1
-
-    if positional != 2:
-        print("Arguments: (initial state) (desired state) [--machine-readable] [--use-cache] [--avoid-overwhelm] [--await-repeats]")
-        sys.exit(1)
+AWAIT_REPEATS = "*Await repeats*"
+DELAY = "*Delay*"
+TIMED_DELAY = "*Delay {} ms*"
 
-    desired_state = configuration.convert_target_state(desired_state, separate(initial_state))
+# With a plan (see timing.Plan) as the solution the delays of its schedule are
+# output instead of the ones for avoiding overwhelm.
+def print_solution(solution, desired_state: str, deadline_ms: int | None, machine_readable_output: bool,
+                   mark_delays_for_avoiding_overwhelm: bool, mark_opportunity_for_awaiting_repeat_inputs: bool):
+    import timing
 
-    try:
-        commandseries = solve_command_series(initial_state, desired_state, use_cache)
-    except InvalidParameters as e:
-        print(str(e))
-        sys.exit(1)
+    commandseries = solution.commands
+    plan = solution if isinstance(solution, timing.Plan) else None
 
     if commandseries is None:
         if not machine_readable_output:
             print("Not a single solution found!")
-        sys.exit(0)
+        return
 
     if not machine_readable_output:
         print("Solution found!")
+        if plan is not None and not solution.optimal:
+            print("(Not proven to be the fastest possible.)")
+        elif deadline_ms is not None and not solution.optimal:
+            print("(Ran out of time before proving it the shortest possible.)")
         print("Execute the following commands in order:")
 
     backled_toggled = False
@@ -113,10 +158,14 @@ if __name__ == "__main__":
     potled_toggled = False
     just_awaited_repeats = False
 
-    for command in commandseries:
+    for i, command in enumerate(commandseries):
         executable, side_effect = configuration.COMMANDS[command]
 
-        if mark_delays_for_avoiding_overwhelm:
+        if plan is not None:
+            ready_ms = plan.start_ms[i - 1] + timing.transmit_ms(commandseries[i - 1]) if i > 0 else 0
+            if plan.start_ms[i] > ready_ms:
+                print(TIMED_DELAY.format(plan.start_ms[i] - ready_ms))
+        elif mark_delays_for_avoiding_overwhelm:
             effects = [executable] + ([side_effect] if side_effect is not None else [])
             add_delay = False
             if any(s.startswith("backled ") for s in effects):
@@ -146,6 +195,88 @@ if __name__ == "__main__":
                 print(AWAIT_REPEATS)
                 just_awaited_repeats = True
 
-    if mark_delays_for_avoiding_overwhelm:
+    if plan is not None:
+        if not machine_readable_output:
+            print("Takes {} ms to execute.".format(plan.total_ms))
+    elif mark_delays_for_avoiding_overwhelm:
         if backled_toggled or frontled_toggled or potled_toggled:
-            print(DELAY)
\ No newline at end of file
+            print(DELAY)
+
+if __name__ == "__main__":
+    import sys
+
+    machine_readable_output = False
+    use_cache = False
+    use_store = False
+    mark_delays_for_avoiding_overwhelm = False
+    mark_opportunity_for_awaiting_repeat_inputs = False
+    workers = 1
+    deadline_ms = None
+    playlist = False
+    fastest = False
+    given_states = []
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--machine-readable":
+            machine_readable_output = True
+        elif sys.argv[i] == "--use-cache":
+            use_cache = True
+        elif sys.argv[i] == "--use-store":
+            use_store = True
+        elif sys.argv[i] == "--avoid-overwhelm":
+            mark_delays_for_avoiding_overwhelm = True
+        elif sys.argv[i] == "--await-repeats":
+            mark_opportunity_for_awaiting_repeat_inputs = True
+        elif sys.argv[i] == "--workers" and i + 1 < len(sys.argv) and sys.argv[i + 1].isdigit():
+            workers = int(sys.argv[i + 1])
+            i += 1
+        elif sys.argv[i] == "--deadline-ms" and i + 1 < len(sys.argv) and sys.argv[i + 1].isdigit():
+            deadline_ms = int(sys.argv[i + 1])
+            i += 1
+        elif sys.argv[i] == "--playlist":
+            playlist = True
+        elif sys.argv[i] == "--fastest":
+            fastest = True
+        else:
+            given_states.append(sys.argv[i])
+        i += 1
+
+    if len(given_states) != 2 and not (playlist and len(given_states) >= 2):
+        print("Arguments: (initial state) (desired state) [--machine-readable] [--use-cache] [--use-store] [--avoid-overwhelm] [--await-repeats] [--workers N] [--deadline-ms N] [--fastest]")
+        print("       or: --playlist (initial state) (desired state) [(desired state) ...] [options as above]")
+        sys.exit(1)
+
+    import solver
+    solver.PARALLEL_WORKERS = workers
+
+    initial_state = given_states[0]
+    desired_states = given_states[1:]
+
+    try:
+        if playlist:
+            playlist_transitions = read_playlist(initial_state, desired_states)
+            desired_states = [", ".join(desired_state) for _, desired_state in playlist_transitions]
+            if fastest:
+                solutions = [solver.solve_fastest(initial, desired, use_cache, deadline_ms, use_store)
+                             for initial, desired in playlist_transitions]
+            else:
+                solutions = solver.solve_playlist(playlist_transitions, use_cache, deadline_ms, use_store)
+        elif fastest:
+            desired_states = [configuration.convert_target_state(desired_states[0], separate(initial_state))]
+            solutions = [solve_fastest(initial_state, desired_states[0], use_cache, deadline_ms, use_store)]
+        else:
+            desired_states = [configuration.convert_target_state(desired_states[0], separate(initial_state))]
+            solutions = [solve_command_series_with_report(initial_state, desired_states[0], use_cache, deadline_ms,
+                                                          use_store)]
+    except InvalidParameters as e:
+        print(str(e))
+        sys.exit(1)
+
+    for i, (desired_state, solution) in enumerate(zip(desired_states, solutions)):
+        if playlist:
+            if i > 0:
+                print()
+            if not machine_readable_output:
+                print("To {}:".format(desired_state))
+        print_solution(solution, desired_state, deadline_ms, machine_readable_output,
+                       mark_delays_for_avoiding_overwhelm, mark_opportunity_for_awaiting_repeat_inputs)
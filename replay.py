@@ -0,0 +1,208 @@
+"""
+Replays a workload log (see main.read_workload_log) against the solver to
+judge changes to it against the actual traffic. The requests are sent at the
+given rate, each REPLAY_RATE per second by default, by up to the given amount
+of concurrent workers, and the report tells the throughput, the latencies,
+where the solutions came from (see solver.Solution) and the errors.
+
+Takes the log as a positional argument, and optionally:
+--rate N:               Send N requests per second, as fast as the workers
+                        allow if 0
+--concurrency N:        Amount of concurrent workers (processes for the
+                        solver, threads for the service)
+--service HOST:PORT:    Replay against a running service.py instead of
+                        main.solve_command_series
+
+Note: the requests are sent on schedule regardless of how long the earlier
+      ones take, like actual traffic would be. A request that has to wait for
+      a free worker is late, and the wait counts towards its latency.
+
+Also note: the flags of the log (--use-cache, --use-store, --deadline-ms N) are
+           applied to each request when replaying against the solver. The
+           service uses the flags it was started with, and each request is
+           replayed as a resync followed by a plan.
+"""
+
+import dataclasses
+
+# Requests per second unless given, 0 for as fast as possible:
+REPLAY_RATE = 0
+# Amount of concurrent workers unless given:
+REPLAY_CONCURRENCY = 1
+# Upper bounds of the buckets of the latency histogram in milliseconds, the last bucket being anything slower:
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+# The outcome of a replayed request: the source of the solution (see
+# solver.Solution) or the error
+@dataclasses.dataclass
+class Result:
+    latency_ms: float
+    source: str | None = None
+    error: str | None = None
+
+@dataclasses.dataclass
+class Report:
+    results: list[Result]
+    elapsed_s: float
+
+    def throughput(self) -> float:
+        return len(self.results) / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    def errors(self) -> dict[str, int]:
+        return _count(result.error for result in self.results if result.error is not None)
+
+    def sources(self) -> dict[str, int]:
+        return _count(result.source for result in self.results if result.error is None)
+
+    # Amount of requests in each bucket of LATENCY_BUCKETS_MS, and the ones slower than the last bucket
+    def histogram(self) -> list[int]:
+        import bisect
+        counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for result in self.results:
+            counts[bisect.bisect_left(LATENCY_BUCKETS_MS, result.latency_ms)] += 1
+        return counts
+
+    def percentile(self, p: float) -> float:
+        latencies = sorted(result.latency_ms for result in self.results)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+def _count(values) -> dict:
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+def replay(requests: list[tuple[str, str, list[str]]], rate: float = REPLAY_RATE,
+           concurrency: int = REPLAY_CONCURRENCY, service: tuple[str, int] | None = None) -> Report:
+    import time
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    if service is not None:
+        executor = ThreadPoolExecutor(concurrency)
+        replay_request = lambda request, due: executor.submit(_replay_on_service, service, request, due)
+    elif concurrency > 1:
+        executor = ProcessPoolExecutor(concurrency, initializer=_init_worker)
+        replay_request = lambda request, due: executor.submit(_replay_on_solver, request, due)
+    else:
+        executor = None
+
+    start = time.monotonic()
+    results = []
+    futures = []
+    for i, request in enumerate(requests):
+        due = start + i / rate if rate > 0 else time.monotonic()
+        time.sleep(max(0.0, due - time.monotonic()))
+        # The due time is passed as wall-clock time as the workers may be other processes
+        wall_due = time.time() - (time.monotonic() - due)
+        if executor is None:
+            results.append(_replay_on_solver(request, wall_due))
+        else:
+            futures.append(replay_request(request, wall_due))
+    if executor is not None:
+        results = [future.result() for future in futures]
+        executor.shutdown()
+    return Report(results, time.monotonic() - start)
+
+def _init_worker():
+    import solver
+    solver.PARALLEL_WORKERS = 1 # the workers are already parallel to each other
+
+def _replay_on_solver(request: tuple[str, str, list[str]], due: float) -> Result:
+    import time
+    import configuration
+    import main
+
+    initial, desired, flags = request
+    deadline_ms = None
+    if "--deadline-ms" in flags and flags.index("--deadline-ms") + 1 < len(flags):
+        deadline_ms = int(flags[flags.index("--deadline-ms") + 1])
+    try:
+        desired = configuration.convert_target_state(desired, main.separate(initial))
+        solution = main.solve_command_series_with_report(initial, desired, "--use-cache" in flags, deadline_ms,
+                                                         "--use-store" in flags)
+        error = None if solution.commands is not None else "Not a single solution found!"
+        return Result((time.time() - due) * 1000, solution.source, error)
+    except main.InvalidParameters as e:
+        return Result((time.time() - due) * 1000, error=str(e))
+    except Exception as e:
+        return Result((time.time() - due) * 1000, error="{}: {}".format(type(e).__name__, e))
+
+# Each request is replayed over a connection and a session of its own, as the
+# service answers one connection at a time
+def _replay_on_service(service: tuple[str, int], request: tuple[str, str, list[str]], due: float) -> Result:
+    import json
+    import socket
+    import threading
+    import time
+
+    initial, desired, _ = request
+    session = "replay-{}".format(threading.get_ident())
+    try:
+        with socket.create_connection(service) as connection, connection.makefile("rwb") as file:
+            def ask(line: str) -> dict:
+                file.write(line.encode() + b"\n")
+                file.flush()
+                return json.loads(file.readline())
+
+            answer = ask("resync {} {}".format(session, initial))
+            if "error" not in answer:
+                answer = ask("plan {} {}".format(session, desired))
+                ask("close {}".format(session))
+        return Result((time.time() - due) * 1000, answer.get("source"), answer.get("error"))
+    except (OSError, ValueError) as e:
+        return Result((time.time() - due) * 1000, error="{}: {}".format(type(e).__name__, e))
+
+def print_report(report: Report):
+    total = len(report.results)
+    print("Replayed {} requests in {:.2f} s: {:.1f} requests/s".format(total, report.elapsed_s, report.throughput()))
+    if total == 0:
+        return
+    print("Latency: p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+        report.percentile(50), report.percentile(90), report.percentile(99), report.percentile(100)))
+    histogram = report.histogram()
+    widest = max(histogram)
+    lower = 0
+    for upper, count in zip(LATENCY_BUCKETS_MS + [None], histogram):
+        label = "{}-{} ms".format(lower, upper) if upper is not None else "> {} ms".format(lower)
+        print("  {:>14} {:>7} {}".format(label, count, "#" * round(40 * count / widest)))
+        lower = upper
+    print("Solutions:")
+    for source, count in report.sources().items():
+        print("  {:<10} {:>7} ({:.1f} %)".format(source, count, 100 * count / total))
+    errors = report.errors()
+    print("Errors: {} ({:.1f} %)".format(sum(errors.values()), 100 * sum(errors.values()) / total))
+    for error, count in errors.items():
+        print("  {:>7} {}".format(count, error))
+
+
+if __name__ == "__main__":
+    import sys
+    import main
+
+    rate = REPLAY_RATE
+    concurrency = REPLAY_CONCURRENCY
+    service = None
+    files = []
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--rate" and i + 1 < len(sys.argv):
+            rate = float(sys.argv[i + 1])
+            i += 1
+        elif sys.argv[i] == "--concurrency" and i + 1 < len(sys.argv) and sys.argv[i + 1].isdigit():
+            concurrency = int(sys.argv[i + 1])
+            i += 1
+        elif sys.argv[i] == "--service" and i + 1 < len(sys.argv):
+            host, _, port = sys.argv[i + 1].rpartition(":")
+            service = (host, int(port))
+            i += 1
+        else:
+            files.append(sys.argv[i])
+        i += 1
+
+    if len(files) != 1:
+        print("Arguments: (workload log) [--rate N] [--concurrency N] [--service HOST:PORT]")
+        sys.exit(1)
+
+    print_report(replay(main.read_workload_log(files[0]), rate, concurrency, service))
@@ -0,0 +1,142 @@
+"""
+Solver service that keeps track of the state of each remote between requests.
+A session is started by telling the state of the devices once (resync), after
+which only the desired state is sent (plan). The state the devices end up in
+after the solution is remembered, so the next solution starts from it without
+parsing, validating or decoding the initial state again.
+
+Running this script serves sessions over TCP (SERVICE_HOST, SERVICE_PORT), one
+request per line and one JSON object per line as the answer:
+  resync (session) (state)  e.g. "resync living-room backled r, frontled g, potled b"
+  plan (session) (desired state)  e.g. "plan living-room frontled b"
+  state (session)
+  close (session)
+The answers tell the commands of the solution and where it came from (plan,
+see solver.Solution), the state of the session (resync, plan, state) or the
+error. The script takes --use-cache, --use-store and --deadline-ms N like
+main.py does.
+
+Note: Only the absolute part of the state is remembered, like between the
+      transitions of a playlist (see main.read_playlist). The relative changes
+      and the calibration caused by a solution can't be told in an initial
+      state, and the cache and the graph only cover states without these (see
+      solver.py), so a relative target is planned afresh on every request.
+
+Also note: the devices may drift from the remembered state, e.g. when someone
+           uses the actual remote. Resync the session whenever that happens.
+"""
+
+from configuration import *
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+
+# session -> the state the devices are in
+_sessions: dict[str, State] = {}
+
+# Starts the session from the given state, or corrects the state of an
+# existing one
+def resync(session: str, given_state: str) -> list[str]:
+    import main
+    import validation as verify
+
+    state = main.separate(given_state)
+    if not verify.is_valid_state(state):
+        raise main.InvalidParameters("Invalid state")
+    if not verify.all_modes_defined(state):
+        raise main.InvalidParameters("Define all modes")
+    if not verify.no_duplicate_mode_definitions(state):
+        raise main.InvalidParameters("No duplicate modes allowed!")
+    if not verify.absolute_state(state):
+        raise main.InvalidParameters("Relative state not allowed as initial")
+    _sessions[session] = read_state(State(), state)
+    return describe_state(_sessions[session])
+
+# Solves from the state of the session to the desired state and assumes the
+# solution gets executed
+def plan(session: str, given_desired_state: str, use_cache: bool = False, deadline_ms: int | None = None,
+         use_store: bool = False):
+    import main
+    import solver
+    import validation as verify
+
+    state = _get_session(session)
+    desired_state = main.separate(convert_target_state(given_desired_state, describe_state(state)))
+    if not verify.is_valid_state(desired_state):
+        raise main.InvalidParameters("Invalid desired end state")
+    if not verify.no_duplicate_mode_definitions(desired_state):
+        raise main.InvalidParameters("No duplicate modes allowed!")
+    if not verify.no_opposites_in_relative_states(desired_state):
+        raise main.InvalidParameters("Simultaneous opposite states not allowed")
+
+    solution = solver.solve_from_state_with_report(state, desired_state, use_cache, deadline_ms, use_store)
+    if solution.commands is not None:
+        for command in solution.commands:
+            state = perform_command(state, command)
+        _sessions[session] = read_state(State(), describe_state(state))
+    return solution
+
+def current_state(session: str) -> State:
+    return _get_session(session)
+
+def close(session: str):
+    _sessions.pop(session, None)
+
+def _get_session(session: str) -> State:
+    import main
+
+    if session not in _sessions:
+        raise main.InvalidParameters("Unknown session, resync it first")
+    return _sessions[session]
+
+# Answers a line of the protocol described above
+def handle_request(line: str, use_cache: bool = False, deadline_ms: int | None = None, use_store: bool = False) -> dict:
+    import main
+
+    request, _, arguments = line.strip().partition(" ")
+    session, _, argument = arguments.partition(" ")
+    try:
+        if not session:
+            raise main.InvalidParameters("No session given")
+        if request == "resync":
+            return {"state": resync(session, argument)}
+        if request == "plan":
+            solution = plan(session, argument, use_cache, deadline_ms, use_store)
+            if solution.commands is None:
+                return {"error": "Not a single solution found!"}
+            return {"commands": [COMMANDS[command][0] for command in solution.commands],
+                    "optimal": solution.optimal, "source": solution.source,
+                    "state": describe_state(current_state(session))}
+        if request == "state":
+            return {"state": describe_state(current_state(session))}
+        if request == "close":
+            close(session)
+            return {}
+        return {"error": "Unknown request " + request}
+    except main.InvalidParameters as e:
+        return {"error": str(e)}
+
+def serve(host: str = SERVICE_HOST, port: int = SERVICE_PORT, use_cache: bool = False,
+          deadline_ms: int | None = None, use_store: bool = False):
+    import json
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                answer = handle_request(line.decode(), use_cache, deadline_ms, use_store)
+                self.wfile.write(json.dumps(answer).encode() + b"\n")
+
+    # One request at a time: the solver shares its lookup structures across requests
+    with socketserver.TCPServer((host, port), Handler) as server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    import sys
+
+    deadline_ms = None
+    if "--deadline-ms" in sys.argv and sys.argv.index("--deadline-ms") + 1 < len(sys.argv):
+        deadline_ms = int(sys.argv[sys.argv.index("--deadline-ms") + 1])
+    print("Serving on {}:{}".format(SERVICE_HOST, SERVICE_PORT))
+    serve(use_cache="--use-cache" in sys.argv, deadline_ms=deadline_ms, use_store="--use-store" in sys.argv)
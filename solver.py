@@ -14,88 +14,519 @@ Note: a more optimal solution is only attempted up the length 3. This is
 
       These solution can and should be cached (see use_cache parameter and
       cache.py). This will reduce the expected time to however many solutions
-      one wishes to cache (the threshold is all slower than 200ms by default).
+      one wishes to cache (the threshold is all that take a search of
+      MAX_STEPS_TO_CHECK by default).
 """
 
 from configuration import *
+import bounds
 import cache
+import graph
+import store
+import timing
+import transitions
 
 MAX_STEPS_TO_CHECK = 3
+# Only explore one order of commands that don't affect each other (see transitions.py):
+PARTIAL_ORDER_REDUCTION = True
+# Amount of worker processes to split the search among (see bfs_parallel, experimental), 1 or less searches in this process:
+PARALLEL_WORKERS = 1
+# Search graph.bin (see graph.py) instead when both states are in it and it was built from the current model:
+USE_GRAPH = True
+# Amount of orders of the target states to try when chaining cached solutions for a compound target:
+COMPOUND_ORDERS_TO_TRY = 6
 
-def solve(initial_state: list[str], desired_state: list[str], use_cache: bool = False) -> list[Command] | None:
-    if use_cache and len(desired_state) == 1:
-        cached_solution = cache.get_cached(initial_state, desired_state[0])
+# A solution along with whether it's proven to be of the least possible length,
+# and where it came from: "cache", "store", "compound" (chained from the cache),
+# "special", "unchanged" (nothing to do) or "search" (including the heuristic).
+# The source doesn't matter when comparing solutions.
+@dataclasses.dataclass
+class Solution:
+    commands: list[Command] | None
+    optimal: bool = False
+    source: str = dataclasses.field(default="search", compare=False)
+
+# Raised by the searches when the deadline passes. All series of commands up to
+# the length depth have been ruled out by then.
+class DeadlineExceeded(Exception):
+    def __init__(self, depth: int):
+        super().__init__(depth)
+        self.depth = depth
+
+def solve(initial_state: list[str], desired_state: list[str], use_cache: bool = False,
+          deadline_ms: int | None = None, use_store: bool = False) -> list[Command] | None:
+    return solve_with_report(initial_state, desired_state, use_cache, deadline_ms, use_store).commands
+
+# A solution from the cache is returned right away, deadline or not, as it
+# takes a search to MAX_STEPS_TO_CHECK to improve on. Otherwise with a deadline
+# the best solution found by then is returned: first from the store or chained
+# from the cache, then from the heuristic and then improved by searching as
+# deep as time allows. With use_store solutions that aren't in the cache are looked up
+# from and stored in the store (see store.py).
+def solve_with_report(initial_state: list[str], desired_state: list[str], use_cache: bool = False,
+                      deadline_ms: int | None = None, use_store: bool = False) -> Solution:
+    return solve_from_state_with_report(read_state(State(), initial_state), desired_state, use_cache, deadline_ms,
+                                        use_store)
+
+# Same as solve_with_report but from an already decoded initial state, which
+# may also have relative changes or calibration (see service.py). The cache
+# only tells apart the states that can be given as initial states, so it's
+# only used for such.
+def solve_from_state_with_report(decoded_initial_state: State, desired_state: list[str], use_cache: bool = False,
+                                 deadline_ms: int | None = None, use_store: bool = False) -> Solution:
+    import time
+    start = time.monotonic()
+    deadline = None if deadline_ms is None else start + deadline_ms / 1000
+    use_cache_for_state = use_cache and encode_state(decoded_initial_state) < BACKLED_REL_BRIGHTNESS
+
+    if use_cache_for_state and len(desired_state) == 1:
+        cached_solution = cache.get_cached_for_state(decoded_initial_state, desired_state[0])
         if cached_solution is not None:
-            return cached_solution
+            return Solution(cached_solution, optimal=len(cached_solution) == 1, source="cache")
 
-    decoded_initial_state = read_state(State(), initial_state)
     decoded_desired_state = read_state(decoded_initial_state, desired_state)
 
-    special_solution = handle_special_case(decoded_initial_state, decoded_desired_state)
+    special_solution = handle_special_case(decoded_initial_state, decoded_desired_state, deadline)
     if special_solution is not None:
-        return special_solution
+        return Solution(special_solution, source="special")
     
     if len(desired_state) == 1 and not is_state_setting_effective(decoded_initial_state, desired_state[0]):
-        return []
+        return Solution([], optimal=True, source="unchanged")
+
+    # The best solution so far, improved upon by searching until the deadline
+    known_solution = None
+    known_source = None
+    if use_store:
+        stored = store.get_stored(encode_state(decoded_initial_state), encode_state(decoded_desired_state))
+        if stored is not None:
+            stored_solution, optimal = stored
+            if optimal or deadline is None:
+                return Solution(stored_solution, optimal, source="store")
+            known_solution, known_source = stored_solution, "store"
+
+    solution = None
+    if use_cache_for_state and len(desired_state) > 1:
+        compound_solution = solve_compound(decoded_initial_state, decoded_desired_state, desired_state, deadline)
+        if compound_solution is not None and deadline is None:
+            solution = Solution(compound_solution, source="compound")
+        elif compound_solution is not None and (known_solution is None or len(compound_solution) < len(known_solution)):
+            known_solution, known_source = compound_solution, "compound"
+
+    if solution is None:
+        solution = solve_internal_with_report(decoded_initial_state, decoded_desired_state, deadline, known_solution,
+                                              use_bounds=use_cache)
+        if known_solution is not None and solution.commands == known_solution:
+            # nothing better was found in time
+            solution.source = known_source
+
+    if use_cache_for_state and cache.JOURNAL_MISSES and len(desired_state) == 1 \
+            and desired_state[0] in cache.TARGET_STATES:
+        cache.journal_miss(decoded_initial_state, desired_state[0], int((time.monotonic() - start) * 1000))
+    if use_store and solution.commands is not None:
+        store.store_solution(encode_state(decoded_initial_state), encode_state(decoded_desired_state),
+                             solution.commands, solution.optimal)
+    return solution
+
+# Like solve_with_report but seeks the solution that is the fastest to execute
+# instead of the shortest (see timing.py). The shortest solution is found
+# first and used as the starting point. Solutions that don't go through states
+# (e.g. calibrating the potled) are only scheduled. The deadline covers both.
+def solve_fastest(initial_state: list[str], desired_state: list[str], use_cache: bool = False,
+                  deadline_ms: int | None = None, use_store: bool = False) -> timing.Plan:
+    import time
+    deadline = None if deadline_ms is None else time.monotonic() + deadline_ms / 1000
+    solution = solve_with_report(initial_state, desired_state, use_cache, deadline_ms, use_store)
+    if solution.commands is None:
+        return timing.Plan(None)
+    decoded_initial_state = read_state(State(), initial_state)
+    decoded_desired_state = read_state(decoded_initial_state, desired_state)
+    if not transitions.replays_to(solution.commands, decoded_initial_state, decoded_desired_state):
+        return timing.schedule(solution.commands, solution.optimal)
+    return timing.fastest(decoded_initial_state, decoded_desired_state, solution.commands, solution.optimal, deadline)
+
+# Solves every transition of a playlist: (initial state, desired state) pairs.
+# Transitions are independent of each other, so repeated ones are solved only
+# once and with several PARALLEL_WORKERS the rest are solved concurrently, one
+# transition per process. Otherwise they're solved in this process where the
+# lookup structures of transitions.py are shared across the whole playlist.
+def solve_playlist(transitions_to_solve: list[tuple[list[str], list[str]]], use_cache: bool = False,
+                   deadline_ms: int | None = None, use_store: bool = False) -> list[Solution]:
+    unique = list(dict.fromkeys((tuple(initial), tuple(desired)) for initial, desired in transitions_to_solve))
+    arguments = [(list(initial), list(desired), use_cache, deadline_ms, use_store) for initial, desired in unique]
+    if PARALLEL_WORKERS > 1 and len(unique) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(min(PARALLEL_WORKERS, len(unique)), initializer=_init_playlist_worker) as executor:
+            solutions = list(executor.map(_solve_playlist_transition, arguments))
+    else:
+        solutions = [_solve_playlist_transition(a) for a in arguments]
+    solved = dict(zip(unique, solutions))
+    return [solved[(tuple(initial), tuple(desired))] for initial, desired in transitions_to_solve]
 
-    return solve_internal(decoded_initial_state, decoded_desired_state)
+def _init_playlist_worker():
+    global PARALLEL_WORKERS
+    PARALLEL_WORKERS = 1 # the workers are already parallel to each other
 
-def solve_internal(decoded_initial_state: State, decoded_desired_state: State) -> list[Command] | None:
+def _solve_playlist_transition(arguments: tuple[list[str], list[str], bool, int | None, bool]) -> Solution:
+    return solve_with_report(*arguments)
+
+def solve_internal(decoded_initial_state: State, decoded_desired_state: State,
+                   deadline: float | None = None) -> list[Command] | None:
+    return solve_internal_with_report(decoded_initial_state, decoded_desired_state, deadline).commands
+
+# The deadline is given in terms of time.monotonic(). Any known solution can be
+# passed as known_solution to only search for better ones. With use_bounds the
+# lengths already ruled out by earlier searches are skipped (see bounds.py).
+def solve_internal_with_report(decoded_initial_state: State, decoded_desired_state: State,
+                               deadline: float | None = None, known_solution: list[Command] | None = None,
+                               use_bounds: bool = False) -> Solution:
+    import sys
     state = encode_state(decoded_initial_state)
     endstate = encode_state(decoded_desired_state)
 
     if state == endstate:
-        return []
+        return Solution([], optimal=True)
     
+    ruled_out = bounds.get_ruled_out_length(state, endstate) if use_bounds else 0
+
     heuristic_solution = solve_with_heuristic(decoded_initial_state, decoded_desired_state)
+    if known_solution is not None and (heuristic_solution is None or len(known_solution) < len(heuristic_solution)):
+        heuristic_solution = known_solution
+
+    if heuristic_solution is not None and len(heuristic_solution) <= ruled_out + 1:
+        return Solution(heuristic_solution, optimal=True)
 
     limit = MAX_STEPS_TO_CHECK
+    if deadline is not None:
+        # Time is bounded by the deadline instead so searching any deeper is fine
+        limit = sys.maxsize
     if heuristic_solution is not None:
         # The heuristic works, still going after a more optimal solution.
         # Note: not checking beyond MAX_STEPS_TO_CHECK so taking a rather
         #       insignificant risk of missing a very slightly better solution
         #       that could take literal days to find.
-        limit = min(len(heuristic_solution) - 1, MAX_STEPS_TO_CHECK)
+        limit = min(len(heuristic_solution) - 1, limit)
     
-    solution = bfs(decoded_initial_state, decoded_desired_state, limit)
+    solution = None
+    if limit > ruled_out:
+        try:
+            csr_graph = graph.load() if USE_GRAPH else None
+            if csr_graph is not None and graph.in_graph(state) and graph.in_graph(endstate):
+                solution = graph.bfs(csr_graph, state, endstate, limit, deadline)
+            elif PARALLEL_WORKERS > 1:
+                solution = bfs_parallel(decoded_initial_state, decoded_desired_state, limit, PARALLEL_WORKERS, deadline)
+            else:
+                solution = bfs(decoded_initial_state, decoded_desired_state, limit, deadline)
+        except DeadlineExceeded as e:
+            if use_bounds:
+                bounds.record_ruled_out_length(state, endstate, e.depth)
+            return Solution(heuristic_solution)
+
+        if use_bounds:
+            bounds.record_ruled_out_length(state, endstate, limit if solution is None else len(solution) - 1)
     
     if solution is not None:
         assert is_solution(solution, decoded_initial_state, decoded_desired_state)
-        return solution
+        return Solution(solution, optimal=True)
 
     if heuristic_solution is not None:
-        return heuristic_solution
+        return Solution(heuristic_solution, optimal=max(limit, ruled_out) == len(heuristic_solution) - 1)
 
-    return None
+    return Solution(None)
+
+# The cache only holds solutions for one target state at a time. A compound
+# target is planned by reaching its target states one by one, chaining the
+# cached solutions through the intermediate states. Target states without a
+# cached solution that works are solved for with the heuristic, or failing
+# that, with a search. Up to COMPOUND_ORDERS_TO_TRY orders of the target states
+# are tried, and the heuristic for the whole target is also considered. The
+# result is not necessarily the shortest possible.
+def solve_compound(decoded_initial_state: State, decoded_desired_state: State, desired_state: list[str],
+                   deadline: float | None = None) -> list[Command] | None:
+    import itertools
+    steps: dict[tuple[int, str], list[Command] | None] = {}
+
+    def solve_step(state: State, target_state: str) -> list[Command] | None:
+        next_state = read_state(state, [target_state])
+        key = (encode_state(state), target_state)
+        if key not in steps:
+            step = None
+            if target_state in cache.TARGET_STATES:
+                step = cache.get_cached_internal(state, next_state, target_state)
+            if not is_solution(step, state, next_state):
+                step = solve_with_heuristic(state, next_state)
+            if step is None:
+                step = solve_internal(state, next_state, deadline)
+            steps[key] = step
+        return steps[key]
+
+    best = solve_with_heuristic(decoded_initial_state, decoded_desired_state)
+    orders = itertools.permutations(sorted(desired_state, key=target_order))
+    for order in itertools.islice(orders, COMPOUND_ORDERS_TO_TRY):
+        solution = []
+        state = decoded_initial_state
+        for target_state in order:
+            if not is_state_setting_effective(state, target_state) or read_state(state, [target_state]) == state:
+                continue
+            step = solve_step(state, target_state)
+            if step is None:
+                solution = None
+                break
+            solution += step
+            state = read_state(state, [target_state])
+        if solution is None or (best is not None and len(solution) >= len(best)):
+            continue
+        if is_solution(solution, decoded_initial_state, decoded_desired_state):
+            best = solution
+    return best
+
+# Devices are switched on first and off last so that they are on for any
+# mode changes. Relative states go after the modes they are relative to.
+def target_order(target_state: str) -> int:
+    if target_state.endswith(" on"):
+        return 0
+    if target_state.endswith(" off"):
+        return 3
+    if any(target_state in opposites for opposites in RELATIVE_STATES):
+        return 2
+    return 1
 
 # breadth-first search
-def bfs(initial_state: State, desired_state: State, limit: int) -> list[Command] | None:
-    from collections import deque
+def bfs(initial_state: State, desired_state: State, limit: int, deadline: float | None = None) -> list[Command] | None:
+    import time
+    from array import array
     if limit == 0:
         return None
     state = encode_state(initial_state)
     endstate = encode_state(desired_state)
     visited = set()
-    q: deque[tuple[int, int]] = deque()
-    q.append((state, 0))
-    commands = COMMANDS.keys()
-    while len(q) > 0:
-        state, encoded_commandseries = q.popleft()
-        decoded_commandseries = decode_commandseries(encoded_commandseries)
-        visited.add(state)
-        decoded_state = decode_state(state)
-        for command in commands:
-            next_state = encode_state(perform_command(decoded_state, command))
-            if next_state in visited:
-                continue
-            next_commandseries_encoded = encode_commandseries(decoded_commandseries, command.value)
-            if next_state == endstate:
-                return to_commands(decode_commandseries(next_commandseries_encoded))
-            if len(decoded_commandseries) == limit - 1:
-                continue
-            q.append((next_state, next_commandseries_encoded))
+    # The search tree is kept as an arena of parallel arrays: node i is the
+    # state states[i] reached from node parents[i] with command commands_taken[i].
+    # Each level occupies a contiguous range of nodes, so the queue is implicit.
+    states = array('q', [state])
+    parents = array('l', [-1])
+    commands_taken = array('B', [0])
+    level_start, level_end = 0, 1
+    for depth in range(limit):
+        for node in range(level_start, level_end):
+            if deadline is not None and time.monotonic() > deadline:
+                raise DeadlineExceeded(depth)
+            state = states[node]
+            visited.add(state)
+            decoded_state = decode_state(state)
+            # Only commands that change the state can lead anywhere new
+            mask = transitions.applicable_mask(decoded_state)
+            if PARTIAL_ORDER_REDUCTION and node > 0:
+                mask &= transitions.commands_after_mask(Command(commands_taken[node]))
+            for command in transitions.commands_in_mask(mask):
+                next_state = transitions.successor(state, decoded_state, command)
+                if next_state in visited:
+                    continue
+                if next_state == endstate:
+                    return to_commands(trace_path(parents, commands_taken, node) + [command.value])
+                if depth == limit - 1:
+                    continue
+                states.append(next_state)
+                parents.append(node)
+                commands_taken.append(command.value)
+        level_start, level_end = level_end, len(states)
+        if level_start == level_end:
+            return None # everything reachable has been visited
     return None
 
+# Rebuilds the series of commands leading to the given node of the search tree
+def trace_path(parents, commands_taken, node: int) -> list[int]:
+    path = []
+    while node > 0:
+        path.append(commands_taken[node])
+        node = parents[node]
+    return path[::-1]
+
+# Breadth-first search with the frontier of each level split among worker
+# processes. Every state is owned by one worker based on its hash: the owner
+# keeps track of whether the state has been visited and expands it when it's
+# in the frontier. The arena of the search tree stays in this process.
+# Successors are passed around as (state, edge) where edge identifies the
+# parent node and the command, and also gives the order of the sequential bfs.
+# The workers are kept between searches (see _bfs_pool), and each one sorts
+# the successors it admits so that merging them here takes a single pass.
+#
+# Note: this is experimental, hence PARALLEL_WORKERS = 1 by default. Passing
+#       the successors between the processes costs about as much as expanding
+#       them, so it only pays off with several idle cores.
+def bfs_parallel(initial_state: State, desired_state: State, limit: int, workers: int,
+                 deadline: float | None = None) -> list[Command] | None:
+    import heapq
+    import itertools
+    from array import array
+    if limit == 0:
+        return None
+    state = encode_state(initial_state)
+    endstate = encode_state(desired_state)
+    states = array('q', [state])
+    parents = array('l', [-1])
+    commands_taken = array('B', [0])
+    connections = _bfs_pool(workers)
+    # The share of the frontier of each worker as (states, edges)
+    frontier = [(array('q'), array('q')) for _ in range(workers)]
+    frontier[owner(state, workers)][0].append(state)
+    frontier[owner(state, workers)][1].append(0)
+    for connection in connections:
+        connection.send(("start", None))
+    for depth in range(limit):
+        # Owners expand their share of the frontier...
+        for connection, work in zip(connections, frontier):
+            connection.send(("expand", (work, endstate)))
+        expanded = _collect(connections, deadline, depth)
+
+        # ...and drop the successors they own that were already visited
+        for i, connection in enumerate(connections):
+            connection.send(("admit", [buckets[i] for buckets in expanded]))
+        admitted = _collect(connections, deadline, depth)
+
+        found = [edge for _, _, edge in admitted if edge is not None]
+        if found:
+            node, command = divmod(min(found), len(COMMANDS))
+            return to_commands(trace_path(parents, commands_taken, node) + [command])
+        if depth == limit - 1:
+            break
+        frontier = [(array('q'), array('q')) for _ in range(workers)]
+        parts = [zip(edges, next_states, itertools.repeat(i)) for i, (next_states, edges, _) in enumerate(admitted)]
+        for edge, next_state, i in heapq.merge(*parts):
+            node, command = divmod(edge, len(COMMANDS))
+            frontier[i][0].append(next_state)
+            frontier[i][1].append(len(states) * len(COMMANDS) + command)
+            states.append(next_state)
+            parents.append(node)
+            commands_taken.append(command)
+        if not any(edges for _, edges in frontier):
+            return None # everything reachable has been visited
+    return None
+
+def owner(state: int, workers: int) -> int:
+    # Fibonacci hashing, as the lowest digits of encoded states hardly vary
+    return ((state * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) * workers >> 64
+
+# The answers of the workers. The deadline is checked while waiting for them,
+# and as the workers are left mid-level by then, they are stopped.
+def _collect(connections, deadline: float | None, depth: int) -> list:
+    import multiprocessing.connection
+    import time
+    answers = {}
+    while len(answers) < len(connections):
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        ready = multiprocessing.connection.wait([c for c in connections if c not in answers], timeout)
+        if not ready:
+            _stop_bfs_pool()
+            raise DeadlineExceeded(depth)
+        for connection in ready:
+            answers[connection] = connection.recv()
+    return [answers[connection] for connection in connections]
+
+# (process id of the owner, the worker processes, the connections to them)
+_bfs_workers: tuple[int, list, list] | None = None
+
+# Starts the workers on first use, or when the amount changes. Processes forked
+# from this one start workers of their own instead of sharing these.
+def _bfs_pool(workers: int) -> list:
+    import atexit
+    import multiprocessing
+    import os
+    global _bfs_workers, _bfs_workers_registered
+    if _bfs_workers is not None and (_bfs_workers[0] != os.getpid() or len(_bfs_workers[2]) != workers):
+        if _bfs_workers[0] == os.getpid():
+            _stop_bfs_pool()
+        _bfs_workers = None
+    if _bfs_workers is None:
+        processes = []
+        connections = []
+        for _ in range(workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_bfs_worker, args=(worker_connection, workers), daemon=True)
+            process.start()
+            processes.append(process)
+            connections.append(connection)
+        if not _bfs_workers_registered:
+            atexit.register(_stop_bfs_pool)
+            _bfs_workers_registered = True
+        _bfs_workers = (os.getpid(), processes, connections)
+    return _bfs_workers[2]
+
+_bfs_workers_registered = False
+
+def _stop_bfs_pool():
+    import os
+    global _bfs_workers
+    if _bfs_workers is None or _bfs_workers[0] != os.getpid():
+        return
+    for process in _bfs_workers[1]:
+        process.terminate()
+    for process in _bfs_workers[1]:
+        process.join()
+    _bfs_workers = None
+
+def _bfs_worker(connection, workers: int):
+    from array import array
+    visited = set()
+    endstate = None
+    while True:
+        message, work = connection.recv()
+        if message == "start":
+            visited = set()
+        elif message == "expand":
+            (states, edges), endstate = work
+            buckets = [(array('q'), array('q')) for _ in range(workers)]
+            for state, edge in zip(states, edges):
+                visited.add(state)
+                node, last_command = divmod(edge, len(COMMANDS))
+                decoded_state = decode_state(state)
+                mask = transitions.applicable_mask(decoded_state)
+                if PARTIAL_ORDER_REDUCTION and node > 0:
+                    mask &= transitions.commands_after_mask(Command(last_command))
+                for command in transitions.commands_in_mask(mask):
+                    next_state = transitions.successor(state, decoded_state, command)
+                    if next_state in visited:
+                        continue
+                    next_states, next_edges = buckets[owner(next_state, workers)]
+                    next_states.append(next_state)
+                    next_edges.append(node * len(COMMANDS) + command.value)
+            connection.send(buckets)
+        elif message == "admit":
+            # The successors it admits in search order, and the edge to the end state if among them. Like in bfs
+            # a state is marked visited only once expanded, so a state reached from several nodes of the level is
+            # admitted once for each, and partial-order reduction sees every command it's reached with.
+            admitted = (array('q'), array('q'))
+            found = None
+            for next_state, edge in zip(*_in_search_order(work)):
+                if next_state in visited:
+                    continue
+                if next_state == endstate:
+                    found = edge
+                    break
+                admitted[0].append(next_state)
+                admitted[1].append(edge)
+            connection.send((admitted[0], admitted[1], found))
+
+def _in_search_order(parts):
+    from array import array
+    states = array('q')
+    edges = array('q')
+    for part_states, part_edges in parts:
+        states.extend(part_states)
+        edges.extend(part_edges)
+    order = sorted(range(len(edges)), key=edges.__getitem__)
+    return array('q', [states[i] for i in order]), array('q', [edges[i] for i in order])
+
+# Depth of the search for a shorter solution than the heuristic one that
+# solve_internal_with_report has to run between the states when nothing is
+# known about them. Unlike the time it takes this is the same on any machine.
+def search_depth(state: State, endstate: State) -> int:
+    if encode_state(state) == encode_state(endstate):
+        return 0
+    heuristic_solution = solve_with_heuristic(state, endstate)
+    if heuristic_solution is None:
+        return MAX_STEPS_TO_CHECK
+    return min(len(heuristic_solution) - 1, MAX_STEPS_TO_CHECK)
+
 def to_commands(intlist: list[int]) -> list[Command]:
     return [Command(c) for c in intlist]
 
@@ -314,33 +745,14 @@ def solve_with_heuristic(state: State, endstate: State) -> list[Command] | None:
 
     return None
 
-def handle_special_case(state: State, endstate: State) -> list[Command] | None:
-    # This particular calibration requires an absurd amount of RED-commands and
-    # as such it's not encoded in the graph and has to be handled semi-manually.
+def handle_special_case(state: State, endstate: State, deadline: float | None = None) -> list[Command] | None:
     if endstate.potled_calibration == 1:
-        calibration_phase = [Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R,
-                             Command.FRONT_DIY5_POT_R] # Yes, really this many.
-        next_state = perform_command(state, Command.FRONT_DIY5_POT_R)
+        next_state = perform_command(state, POTLED_CALIBRATION_PHASE[0])
         # Attempt to return back to previous state
-        steps_to_return = solve_internal(next_state, state)
+        steps_to_return = solve_internal(next_state, state, deadline)
         if steps_to_return is not None:
-            return calibration_phase + steps_to_return
-        return calibration_phase # No can do.
+            return POTLED_CALIBRATION_PHASE + steps_to_return
+        return list(POTLED_CALIBRATION_PHASE) # No can do.
     
     return None
 
@@ -0,0 +1,335 @@
+"""
+Declarative form of the model in configuration.py: the devices, their modes
+and relative changes, and what each command does to them are told in a spec
+file (see devices.json), from which compile_spec builds the commands, the
+layout of the encoded state and tables for performing the commands on encoded
+states. Adapting the solver to another set of devices is then a matter of
+writing their spec rather than rewriting perform_command.
+
+The spec tells for each device:
+  fields: the fields of the device other than its mode, and their lengths
+  modes: the modes of the device, the first color_modes of them being colors
+  dimensions: the relative changes, each a field (or a field per mode, with
+              {mode} in the name) and the modes in which it can be changed:
+              "color", "other" or a list of them. A digit picks a trit from a
+              field holding several of them (e.g. the channels of an rgb).
+  buttons: what each button of the remote does, by the following actions
+    mode: sets the mode (buttons named after a mode do this by default)
+    set: sets the given fields to the given values
+    toggle: switches the given field between 0 and 1
+    adjust: changes the first of the given dimensions that can be changed in
+            the current mode to "to" (1 = increase, 2 = decrease). Forbidden if
+            it's already there, and as it can't be known whether the opposite
+            change has reached its limit, when it's the opposite one if
+            relative_changes_exclusive (see AVOID_CHANGING_RELATIVE_STATE_NEEDLESSLY)
+    cycle: advances the given field to its next value, the last to the first
+  The actions take effect only while the device is on, except for those in
+  "always" that take effect regardless and those in "off" that take effect
+  only while it's off.
+The commands are the signals of the remotes in order, each with the button it
+is meant for (executable) and the button of another device it's mistaken for
+(side effect), as in COMMANDS. The layout lists the fields of the encoded
+state from the least significant one, each prefixed by its device.
+
+Note: the actions of a command are decided from the state before it; any
+      device forbidding the command forbids it as a whole, like in
+      perform_command.
+
+Also note: the per-device tables of transitions.py are derived from the
+           spec, so the searches, the graph (see graph.py) and the replays of
+           cached solutions all follow it, while e.g. solver.is_solution and
+           the special cases still follow perform_command in configuration.py.
+           Nothing makes the two equivalent: load refuses a spec that differs
+           from perform_command in LOAD_CHECK_SAMPLES random states, and the
+           model fingerprint (see transitions.model_fingerprint) covers both.
+           Running this script checks more states (--check N compares N
+           random states) and tells how much faster the tables are. fuzz.py
+           checks the same continuously.
+"""
+
+import dataclasses
+import json
+import pathlib
+from enum import Enum
+
+# The spec of the devices the solver was written for:
+SPEC_FILE = pathlib.Path(__file__).parent.absolute().as_posix() + "/devices.json"
+
+# What a command does to a device in a given absolute state (see DeviceTable):
+# the change to the encoded state, the (weight, to) of a relative change and
+# the (weight, length) of a cycled field
+Entry = tuple[int, tuple[int, int] | None, tuple[int, int] | None]
+
+# The absolute fields of a device are the ones its actions depend on: on/off,
+# the mode and those set or toggled. The key of a device state combines them,
+# and the entries tell what each command does in each key. Everything else is
+# relative and read by the entry only when needed.
+@dataclasses.dataclass
+class DeviceTable:
+    device: str
+    key_fields: list[tuple[int, int, int]]  # position, length and stride in the key
+    entries: list[list[Entry]]  # [command value][key]
+
+    def key(self, encoded: int) -> int:
+        key = 0
+        for position, length, stride in self.key_fields:
+            key += encoded // position % length * stride
+        return key
+
+@dataclasses.dataclass
+class Model:
+    commands: list[tuple[str, str, str | None]]  # name, executable, side effect
+    modes: dict[str, list[str]]  # device -> the modes as in BACKLED_MODES etc.
+    color_modes: dict[str, list[int]]  # device -> the indices of the color modes
+    layout: list[tuple[str, int, int]]  # field, position and length, least significant first
+    tables: list[DeviceTable]
+    relative_changes_exclusive: bool
+
+    def state_max_size(self) -> int:
+        field, position, length = self.layout[-1]
+        return position * length - 1
+
+    # An Enum of the commands like configuration.Command
+    def command_enum(self, name: str = "Command") -> type[Enum]:
+        return Enum(name, [(command, value) for value, (command, _, _) in enumerate(self.commands)])
+
+    def position(self, field: str) -> int:
+        return next(position for name, position, _ in self.layout if name == field)
+
+    # The encoded state after the command of the given value, or None if the
+    # command is forbidden
+    def successor(self, encoded: int, command: int) -> int | None:
+        successor = encoded
+        for table in self.tables:
+            change = self._change(table, table.key(encoded), encoded, command)
+            if change is None:
+                return None
+            successor += change
+        return successor
+
+    # successor for every command, in the order of command values
+    def successors(self, encoded: int) -> list[int | None]:
+        keys = [table.key(encoded) for table in self.tables]
+        successors = []
+        for command in range(len(self.commands)):
+            successor = encoded
+            for table, key in zip(self.tables, keys):
+                change = self._change(table, key, encoded, command)
+                if change is None:
+                    successor = None
+                    break
+                successor += change
+            successors.append(successor)
+        return successors
+
+    # successor for every command as far as the given device is concerned:
+    # from and to the part of the encoded state of that device alone, None
+    # where the device forbids the command (see transitions.device_transitions)
+    def device_successors(self, device: str, encoded: int) -> list[int | None]:
+        table = next(table for table in self.tables if table.device == device)
+        key = table.key(encoded)
+        successors = []
+        for command in range(len(self.commands)):
+            change = self._change(table, key, encoded, command)
+            successors.append(None if change is None else encoded + change)
+        return successors
+
+    # The change to the encoded state by the command on the device of the
+    # table, None if the device forbids the command
+    def _change(self, table: DeviceTable, key: int, encoded: int, command: int) -> int | None:
+        delta, adjust, cycle = table.entries[command][key]
+        if adjust is not None:
+            weight, to = adjust
+            trit = encoded // weight % 3
+            if trit == to or trit != 0 and self.relative_changes_exclusive:
+                return None # this is a forbidden move
+            delta += (to if trit == 0 else -trit) * weight
+        if cycle is not None:
+            weight, length = cycle
+            value = encoded // weight % length
+            delta += ((value + 1) % length - value) * weight
+        return delta
+
+def load_spec(path: str = SPEC_FILE) -> dict:
+    with open(path, "r") as file:
+        return json.load(file)
+
+# The amount of random states in which the model is checked against
+# perform_command when loaded:
+LOAD_CHECK_SAMPLES = 256
+
+_loaded: tuple[str, Model] | None = None
+
+# The model compiled from the spec file, compiled once per process. The
+# searches follow the model while the rest of the solver (e.g.
+# solver.is_solution) follows perform_command, so a model that doesn't match
+# perform_command is refused instead of giving plans that don't work.
+def load(path: str = SPEC_FILE) -> Model:
+    global _loaded
+    if _loaded is None or _loaded[0] != path:
+        model = compile_spec(load_spec(path))
+        mismatch, _, _ = check(model, LOAD_CHECK_SAMPLES)
+        if mismatch is not None:
+            raise ValueError("The spec doesn't match perform_command in state {} with {}: expected {}, got {}"
+                             .format(*mismatch))
+        _loaded = (path, model)
+    return _loaded[1]
+
+def compile_spec(spec: dict) -> Model:
+    devices = spec["devices"]
+    lengths = {}
+    for device, definition in devices.items():
+        lengths[device + "_mode"] = len(definition["modes"])
+        for field, length in definition["fields"].items():
+            lengths[device + "_" + field] = length
+
+    layout = []
+    position = 1
+    for field in spec["layout"]:
+        if field not in lengths:
+            raise ValueError("Unknown field in layout: " + field)
+        layout.append((field, position, lengths[field]))
+        position *= lengths[field]
+    positions = {field: (position, length) for field, position, length in layout}
+    missing = [field for field in lengths if field not in positions]
+    if missing:
+        raise ValueError("Fields missing from layout: " + ", ".join(missing))
+
+    commands = [(command["name"], command["executable"], command["side_effect"]) for command in spec["commands"]]
+    tables = [_compile_device(device, definition, commands, positions) for device, definition in devices.items()]
+    return Model(commands,
+                 {device: [device + " " + mode for mode in definition["modes"]] for device, definition in devices.items()},
+                 {device: list(range(definition["color_modes"])) for device, definition in devices.items()},
+                 layout, tables, spec["relative_changes_exclusive"])
+
+# The button of the device each command presses, if any
+def _buttons_pressed(device: str, commands: list[tuple[str, str, str | None]]) -> list[str | None]:
+    pressed = []
+    for name, executable, side_effect in commands:
+        buttons = [effect.split(" ", 1)[1] for effect in [executable, side_effect]
+                   if effect is not None and effect.split(" ", 1)[0] == device]
+        if len(buttons) > 1:
+            raise ValueError("Command {} presses several buttons of {}".format(name, device))
+        pressed.append(buttons[0] if buttons else None)
+    return pressed
+
+def _compile_device(device: str, definition: dict, commands: list[tuple[str, str, str | None]],
+                    positions: dict[str, tuple[int, int]]) -> DeviceTable:
+    modes = definition["modes"]
+    buttons = {mode: {"mode": mode} for mode in modes} | definition["buttons"]
+    pressed = _buttons_pressed(device, commands)
+    for button in pressed:
+        if button is not None and button not in buttons:
+            raise ValueError("Unknown button: {} {}".format(device, button))
+
+    absolute = ["on", "mode"]
+    for action in [a for button in buttons.values() for a in [button, button.get("always", {}), button.get("off", {})]]:
+        for field in list(action.get("set", {})) + ([action["toggle"]] if "toggle" in action else []):
+            if field not in absolute:
+                absolute.append(field)
+    key_fields = []
+    stride = 1
+    for field in absolute:
+        position, length = positions[device + "_" + field]
+        key_fields.append((position, length, stride))
+        stride *= length
+
+    def field_weight(field: str, digit: int = 0) -> int:
+        return positions[device + "_" + field][0] * 3 ** digit
+
+    def dimension_modes(dimension: dict) -> list[int]:
+        match dimension["modes"]:
+            case "color":
+                return list(range(definition["color_modes"]))
+            case "other":
+                return list(range(definition["color_modes"], len(modes)))
+            case names:
+                return [modes.index(name) for name in names]
+
+    # The entry of pressing the button in the given absolute device state
+    def entry(button: str | None, values: dict[str, int]) -> Entry:
+        if button is None:
+            return 0, None, None
+        new_values = dict(values)
+        adjust = None
+        cycle = None
+        actions = [buttons[button].get("always", {})]
+        actions.append(buttons[button] if values["on"] == 1 else buttons[button].get("off", {}))
+        for action in actions:
+            if "mode" in action:
+                new_values["mode"] = modes.index(action["mode"])
+            for field, value in action.get("set", {}).items():
+                new_values[field] = value
+            if "toggle" in action:
+                new_values[action["toggle"]] = 1 - values[action["toggle"]]
+            if "cycle" in action:
+                cycle = field_weight(action["cycle"]), positions[device + "_" + action["cycle"]][1]
+            for name in action.get("adjust", []):
+                dimension = definition["dimensions"][name]
+                if values["mode"] in dimension_modes(dimension):
+                    field = dimension["field"].format(mode=modes[values["mode"]])
+                    adjust = field_weight(field, dimension.get("digit", 0)), action["to"]
+                    break
+        delta = sum((new_values[field] - values[field]) * position
+                    for field, (position, _, _) in zip(absolute, key_fields))
+        return delta, adjust, cycle
+
+    keys = [{field: key // stride % length for field, (_, length, stride) in zip(absolute, key_fields)}
+            for key in range(stride)]
+    entries = [[entry(button, values) for values in keys] for button in pressed]
+    return DeviceTable(device, key_fields, entries)
+
+# Compares the model against perform_command in the given amount of random
+# states, half of them absolute, and returns the first mismatch as (encoded
+# state, command, perform_command's successor, model's successor) if any,
+# along with the time each took in seconds
+def check(model: Model, samples: int, seed: int = 0) -> tuple[tuple | None, float, float]:
+    import random
+    import time
+    from configuration import BACKLED_REL_BRIGHTNESS, COMMANDS, FRONTLED_CALIBRATION, FRONTLED_CALIBRATION_LENGTH, \
+        STATE_MAX_SIZE, decode_state, encode_state, perform_command
+
+    generator = random.Random(seed)
+    states = []
+    for n in range(samples):
+        if n % 2 == 0: # absolute states, see graph.py
+            states.append(generator.randrange(BACKLED_REL_BRIGHTNESS)
+                          + generator.randrange(FRONTLED_CALIBRATION_LENGTH) * FRONTLED_CALIBRATION)
+        else:
+            states.append(generator.randrange(STATE_MAX_SIZE + 1))
+
+    start = time.perf_counter()
+    expected = []
+    for encoded in states:
+        state = decode_state(encoded)
+        successors = []
+        for command in COMMANDS:
+            new_state = perform_command(state, command)
+            successors.append(None if new_state is state else encode_state(new_state))
+        expected.append(successors)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [model.successors(encoded) for encoded in states]
+    model_time = time.perf_counter() - start
+
+    for encoded, expected_successors, actual_successors in zip(states, expected, actual):
+        for command, expected_successor, actual_successor in zip(COMMANDS, expected_successors, actual_successors):
+            if expected_successor != actual_successor:
+                return (encoded, command, expected_successor, actual_successor), reference_time, model_time
+    return None, reference_time, model_time
+
+
+if __name__ == "__main__":
+    import sys
+
+    samples = 10000
+    if "--check" in sys.argv and sys.argv.index("--check") + 1 < len(sys.argv):
+        samples = int(sys.argv[sys.argv.index("--check") + 1])
+    mismatch, reference_time, model_time = check(compile_spec(load_spec()), samples)
+    if mismatch is not None:
+        print("Mismatch in state {} with {}: expected {}, got {}".format(*mismatch))
+        sys.exit(1)
+    print("The spec matches perform_command in {} states.".format(samples))
+    print("perform_command: {:.2f} s, tables: {:.2f} s ({:.1f}x faster)".format(
+        reference_time, model_time, reference_time / model_time if model_time > 0 else float("inf")))
@@ -0,0 +1,76 @@
+"""
+Persistent store for the solutions found by searching. Whatever misses the
+cache (see cache.py) is solved live, e.g. compound and relative targets, and
+stored in store.sqlite3 by the encoded initial and desired state so that the
+same request is answered from storage from then on.
+
+Note: the store is bounded by STORE_MAX_SOLUTIONS. The least recently used
+      solutions are evicted first.
+
+Also note: the solutions are only valid for the graph they were found in.
+           The store holds the fingerprint of the model (see
+           transitions.model_fingerprint), and the solutions of another model
+           are removed when the store is opened.
+"""
+
+from configuration import Command
+import pathlib
+
+# SQLite database to store the solutions:
+STORE_FILE = pathlib.Path(__file__).parent.absolute().as_posix() + "/store.sqlite3"
+# Upper bound for the amount of stored solutions:
+STORE_MAX_SOLUTIONS = 100000
+
+_connection = None
+_connection_file = None
+
+def _connect():
+    import sqlite3
+    import transitions
+    global _connection, _connection_file
+    if _connection is None or _connection_file != STORE_FILE:
+        _connection = sqlite3.connect(STORE_FILE)
+        _connection_file = STORE_FILE
+        _connection.execute("CREATE TABLE IF NOT EXISTS solutions ("
+                            "state INTEGER, endstate INTEGER, commands BLOB, optimal INTEGER, used REAL, "
+                            "PRIMARY KEY (state, endstate))")
+        _connection.execute("CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)")
+        _connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB)")
+        row = _connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        # A store without a fingerprint predates it, so its model isn't known either
+        if row is None or row[0] != transitions.model_fingerprint():
+            with _connection:
+                _connection.execute("DELETE FROM solutions")
+                _connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)",
+                                    (transitions.model_fingerprint(),))
+    return _connection
+
+# The stored solution between the encoded states and whether it's the shortest possible
+def get_stored(state: int, endstate: int) -> tuple[list[Command], bool] | None:
+    import time
+    connection = _connect()
+    row = connection.execute("SELECT commands, optimal FROM solutions WHERE state = ? AND endstate = ?",
+                             (state, endstate)).fetchone()
+    if row is None:
+        return None
+    with connection:
+        connection.execute("UPDATE solutions SET used = ? WHERE state = ? AND endstate = ?",
+                           (time.time(), state, endstate))
+    commands, optimal = row
+    return [Command(value) for value in commands], bool(optimal)
+
+# Stores the solution unless an at least as good one is already stored
+def store_solution(state: int, endstate: int, solution: list[Command], optimal: bool):
+    import time
+    connection = _connect()
+    row = connection.execute("SELECT length(commands), optimal FROM solutions WHERE state = ? AND endstate = ?",
+                             (state, endstate)).fetchone()
+    if row is not None:
+        stored_length, stored_optimal = row
+        if stored_optimal or (stored_length <= len(solution) and not optimal):
+            return
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?, ?)",
+                           (state, endstate, bytes(command.value for command in solution), int(optimal), time.time()))
+        connection.execute("DELETE FROM solutions WHERE rowid IN (SELECT rowid FROM solutions ORDER BY used DESC "
+                           "LIMIT -1 OFFSET ?)", (STORE_MAX_SOLUTIONS,))
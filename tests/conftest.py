@@ -0,0 +1,15 @@
+import pytest
+
+import bounds
+import cache
+import store
+
+# The solver persists what it learns next to the sources (bounds.bin, misses.bin,
+# store.sqlite3). Each test gets files of its own so that no test depends on
+# what earlier runs left behind.
+@pytest.fixture(autouse=True)
+def learned_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(bounds, "BOUNDS_FILE", str(tmp_path / "bounds.bin"))
+    monkeypatch.setattr(bounds, "_ruled_out", None)
+    monkeypatch.setattr(cache, "JOURNAL_FILE", str(tmp_path / "misses.bin"))
+    monkeypatch.setattr(store, "STORE_FILE", str(tmp_path / "store.sqlite3"))
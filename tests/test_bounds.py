@@ -0,0 +1,32 @@
+import pytest
+
+import bounds
+
+def test_ruled_out_lengths_persist(tmp_path, monkeypatch):
+    monkeypatch.setattr(bounds, "BOUNDS_FILE", str(tmp_path / "bounds.bin"))
+    monkeypatch.setattr(bounds, "_ruled_out", None)
+    assert bounds.get_ruled_out_length(15518461, 1) == 0
+    bounds.record_ruled_out_length(15518461, 1, 3)
+    bounds.record_ruled_out_length(15518461, 1, 2) # weaker, not recorded
+    bounds.record_ruled_out_length(1, 15518461, 1)
+
+    monkeypatch.setattr(bounds, "_ruled_out", None)
+    assert bounds.get_ruled_out_length(15518461, 1) == 3
+    assert bounds.get_ruled_out_length(1, 15518461) == 1
+    assert (tmp_path / "bounds.bin").stat().st_size == 8 + 2 * 17
+
+def test_bounds_of_another_model_ignored(tmp_path, monkeypatch):
+    import transitions
+    monkeypatch.setattr(bounds, "BOUNDS_FILE", str(tmp_path / "bounds.bin"))
+    monkeypatch.setattr(bounds, "_ruled_out", None)
+    bounds.record_ruled_out_length(15518461, 1, 3)
+    data = (tmp_path / "bounds.bin").read_bytes()
+    (tmp_path / "bounds.bin").write_bytes(bytes(8) + data[8:])
+
+    monkeypatch.setattr(bounds, "_ruled_out", None)
+    assert bounds.get_ruled_out_length(15518461, 1) == 0
+    bounds.record_ruled_out_length(1, 15518461, 1) # replaces the file
+    monkeypatch.setattr(bounds, "_ruled_out", None)
+    assert bounds.get_ruled_out_length(15518461, 1) == 0
+    assert bounds.get_ruled_out_length(1, 15518461) == 1
+    assert (tmp_path / "bounds.bin").read_bytes()[:8] == transitions.model_fingerprint()
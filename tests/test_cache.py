@@ -0,0 +1,193 @@
+import pytest
+
+from configuration import *
+import cache
+
+def test_state_combination_encoding():
+    state = read_state(State(), ["backled g", "frontled b3", "potled r4", "frontled off"])
+    assert cache.decode_state_combination(cache.encode_state_combination(state, "backled g3")) == (state, "backled g3")
+
+def test_warm_caches_journaled_misses(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_FILE", str(tmp_path / "cache.bin"))
+    monkeypatch.setattr(cache, "CACHE_PACK_FILE", str(tmp_path / "cache.pack"))
+    monkeypatch.setattr(cache, "JOURNAL_FILE", str(tmp_path / "misses.bin"))
+    (tmp_path / "cache.bin").write_bytes(b"")
+    initial_state = read_state(State(), ["backled g", "frontled b3", "potled r4"])
+    desired_state = read_state(initial_state, ["backled g3"])
+    cache.journal_miss(initial_state, "backled g3", 1000) # the heuristic is all but proven the shortest
+    cache.warm()
+    assert cache.get_cached_internal(initial_state, desired_state, "backled g3") is None
+
+    initial_state = read_state(State(), ["backled r", "frontled r5", "potled r"])
+    desired_state = read_state(initial_state, ["backled w"])
+    cache.journal_miss(initial_state, "backled w", 50)
+    cache.warm()
+    assert cache.get_cached_internal(initial_state, desired_state, "backled w") == \
+        [Command.BACK_W_FRONT_FADE7, Command.FRONT_R5_POT_G4, Command.FRONT_ONOFF, Command.FRONT_DIY5_POT_R, Command.FRONT_ONOFF]
+    assert not (tmp_path / "misses.bin").exists()
+
+def test_report(tmp_path):
+    log = tmp_path / "workload.jsonl"
+    log.write_text('{"initial": "backled r, frontled r5, potled r", "desired": "backled w", "flags": ["--use-cache"]}\n'
+                   '{"initial": "backled g, frontled b3, potled r4", "desired": "backled g3"}\n'
+                   '{"initial": "backled g, frontled b3, potled r4", "desired": "backled g"}\n'
+                   '{"initial": "backled g, frontled b3, potled r4", "desired": "backled g3, frontled r"}\n'
+                   '{"initial": "backled g, frontled b3", "desired": "backled g"}\n')
+    assert cache.report(str(log)) == {"hit": 1, "shallow miss": 1, "no change": 1, "not cacheable": 1, "invalid": 1}
+
+def test_pack():
+    records = [(index * 7 + index % 5, [9178, 633284, 7798][index % 3]) for index in range(1000)]
+    records += [(10000 + index * 200, 1 + index) for index in range(300)] # some wide gaps
+    pack = cache.unpack(cache.pack(records))
+    for index, encoded in records:
+        assert cache.find_packed(pack, index) == cache.decode_solution(encoded)
+    indices = {index for index, _ in records}
+    for index in range(-1, 70000):
+        if index not in indices:
+            assert cache.find_packed(pack, index) is None
+
+def test_replays_to_agrees_with_is_solution():
+    import random
+    import solver
+    import transitions
+    generator = random.Random(1)
+    for _ in range(200):
+        state = decode_state(generator.randrange(BACKLED_REL_BRIGHTNESS))
+        solution = [generator.choice(list(COMMANDS)) for _ in range(generator.randrange(4))]
+        endstate = state
+        for command in solution:
+            endstate = perform_command(endstate, command)
+        assert transitions.replays_to(solution, state, endstate) == solver.is_solution(solution, state, endstate)
+
+def test_verify_drops_stale_records(tmp_path, monkeypatch):
+    import transitions
+    monkeypatch.setattr(cache, "CACHE_FILE", str(tmp_path / "cache.bin"))
+    monkeypatch.setattr(cache, "CACHE_PACK_FILE", str(tmp_path / "cache.pack"))
+    monkeypatch.setattr(cache, "FINGERPRINT_FILE", str(tmp_path / "cache.fingerprint"))
+    initial_state = read_state(State(), ["backled g", "frontled b3", "potled r4"])
+    index = cache.encode_state_combination(initial_state, "backled g3")
+    good = cache.encode_solution([Command.BACK_G3_FRONT_DIY2, Command.FRONT_B3])
+    stale = cache.encode_solution([Command.FRONT_B3])
+    (tmp_path / "cache.bin").write_bytes(index.to_bytes(4, byteorder='big') + good.to_bytes(4, byteorder='big')
+                                         + (index + 8).to_bytes(4, byteorder='big') + stale.to_bytes(4, byteorder='big'))
+    assert cache.verify() == [index + 8]
+    assert not (tmp_path / "cache.fingerprint").exists()
+    assert cache.verify(drop=True) == [index + 8]
+    assert cache.read_records() == [(index, good)]
+    assert (tmp_path / "cache.fingerprint").read_text().strip() == transitions.model_fingerprint().hex()
+
+    (tmp_path / "cache.fingerprint").write_text("0000000000000000\n")
+    assert cache.get_cached_internal0(initial_state, "backled g3") is None
+    cache.stamp_fingerprint()
+    assert cache.get_cached_internal0(initial_state, "backled g3") == [Command.BACK_G3_FRONT_DIY2, Command.FRONT_B3]
+
+def test_verify_replays_perform_command(tmp_path, monkeypatch):
+    import solver
+    monkeypatch.setattr(cache, "CACHE_FILE", str(tmp_path / "cache.bin"))
+    monkeypatch.setattr(cache, "CACHE_PACK_FILE", str(tmp_path / "cache.pack"))
+    monkeypatch.setattr(cache, "FINGERPRINT_FILE", str(tmp_path / "cache.fingerprint"))
+    initial_state = read_state(State(), ["backled g", "frontled b3", "potled r4"])
+    index = cache.encode_state_combination(initial_state, "backled g3")
+    good = cache.encode_solution([Command.BACK_G3_FRONT_DIY2, Command.FRONT_B3])
+    (tmp_path / "cache.bin").write_bytes(index.to_bytes(4, byteorder='big') + good.to_bytes(4, byteorder='big'))
+    assert cache.verify() == []
+
+    def perform_without_front_b3(state, command):
+        return state if command == Command.FRONT_B3 else perform_command(state, command)
+    monkeypatch.setattr(solver, "perform_command", perform_without_front_b3) # the spec tables are left as they were
+    assert cache.verify() == [index]
+
+def test_pack_is_memory_mapped(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_FILE", str(tmp_path / "cache.bin"))
+    monkeypatch.setattr(cache, "CACHE_PACK_FILE", str(tmp_path / "cache.pack"))
+    records = [(index * 3, 9178 + index % 7) for index in range(500)]
+    (tmp_path / "cache.bin").write_bytes(b"".join(index.to_bytes(4, byteorder='big') + encoded.to_bytes(4, byteorder='big')
+                                                  for index, encoded in records))
+    cache.write_pack()
+    pack = cache.load_pack()
+    assert isinstance(pack.stream, memoryview)
+    for index, encoded in records:
+        assert cache.find_packed(pack, index) == cache.decode_solution(encoded)
+    # replaced, not overwritten, under the mapping
+    cache.merge_records([(1, 7798)])
+    assert cache.find_packed(pack, 3) == cache.decode_solution(9178 + 1)
+    assert cache.find_packed(cache.load_pack(), 1) == cache.decode_solution(7798)
+
+def test_pack_keeps_variants(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_FILE", str(tmp_path / "cache.bin"))
+    monkeypatch.setattr(cache, "CACHE_PACK_FILE", str(tmp_path / "cache.pack"))
+    base = 8 * 1000
+    records = [(base + 1, 9178), # built before regrouping
+               (1 << 3 + cache.VARIANT_MASK_SHIFT | base + 3, 9179), # for its own variant only
+               (0b11000000 << cache.VARIANT_MASK_SHIFT | base + 6, 9180),
+               (cache.SPECIAL_INDEX_OFFSET + 5, 9181)]
+    records = [(key + 8 * n, encoded) for n in range(3 * cache.PACK_BLOCK_SIZE) for key, encoded in records]
+    records.sort()
+    (tmp_path / "cache.bin").write_bytes(b"".join(key.to_bytes(4, byteorder='big') + encoded.to_bytes(4, byteorder='big')
+                                                  for key, encoded in records))
+    cache.write_pack()
+    assert cache.packed_records_between(cache.load_pack(), 0, 1 << cache.VARIANT_MASK_SHIFT) == records
+
+def test_packed_records_of_many(tmp_path, monkeypatch):
+    import random
+    monkeypatch.setattr(cache, "CACHE_FILE", str(tmp_path / "cache.bin"))
+    monkeypatch.setattr(cache, "CACHE_PACK_FILE", str(tmp_path / "cache.pack"))
+    generator = random.Random(2)
+    combinations = sorted(generator.sample(range(8 * 20 * cache.PACK_BLOCK_SIZE), 10 * cache.PACK_BLOCK_SIZE))
+    (tmp_path / "cache.bin").write_bytes(b"".join(index.to_bytes(4, byteorder='big') + (9178 + index % 5).to_bytes(4, byteorder='big')
+                                                  for index in combinations))
+    cache.write_pack()
+    pack = cache.load_pack()
+    # nearby ones share a block, repeated ones and ones past the last record included
+    bases = sorted([8 * generator.randrange(22 * cache.PACK_BLOCK_SIZE) for _ in range(300)] * 2)
+    assert cache.packed_records_of_many(pack, bases) == [cache.packed_records_between(pack, base, base + 8) for base in bases]
+    assert any(cache.packed_records_of_many(pack, bases))
+
+def test_variants_are_found_in_a_single_probe(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_FILE", str(tmp_path / "cache.bin"))
+    monkeypatch.setattr(cache, "CACHE_PACK_FILE", str(tmp_path / "cache.pack"))
+    state = read_state(State(), ["backled g", "frontled b3", "potled r4", "backled off", "frontled off", "potled off"])
+    base = cache.encode_state_combination(state, "backled g3")
+    good = cache.encode_solution([Command.BACK_G3_FRONT_DIY2, Command.FRONT_B3])
+    # as built before the records were regrouped: only for the state combination itself
+    (tmp_path / "cache.bin").write_bytes(base.to_bytes(4, byteorder='big') + good.to_bytes(4, byteorder='big'))
+    variants = [dataclasses.replace(state, backled_on=backled_on, frontled_on=frontled_on, potled_on=potled_on)
+                for backled_on in [0, 1] for frontled_on in [0, 1] for potled_on in [0, 1]]
+    assert cache.get_cached_internal0(variants[6], "backled g3") is None
+
+    cache.canonicalize()
+    # the solution works only with the backled and the frontled on, the backled being off renders the target ineffective
+    assert cache.read_records() == [(0b11000000 << cache.VARIANT_MASK_SHIFT | base + 6, good)]
+    assert cache.verify() == []
+    for pack in [False, True]:
+        if pack:
+            cache.write_pack()
+        for variant, variant_state in enumerate(variants):
+            desired_state = read_state(variant_state, ["backled g3"])
+            expected = cache.decode_solution(good) if variant in [6, 7] else None
+            assert cache.get_cached_internal(variant_state, desired_state, "backled g3") == expected
+
+    # a solution only for the potled being off splits the group
+    other = cache.encode_solution([Command.FRONT_B5_POT_B4, Command.BACK_G3_FRONT_DIY2, Command.FRONT_B3])
+    cache.merge_records([(base + 6, other)], regroup_added=True)
+    assert cache.read_records() == [(0b01000000 << cache.VARIANT_MASK_SHIFT | base + 6, other),
+                                    (0b10000000 << cache.VARIANT_MASK_SHIFT | base + 7, good)]
+
+def test_get_cached_many(tmp_path, monkeypatch):
+    import random
+    generator = random.Random(1)
+    queries = []
+    for backled_mode, frontled_mode in [("backled r", "frontled r5"), ("backled g", "frontled b3")]:
+        state = read_state(State(), [backled_mode, frontled_mode, "potled r"])
+        queries += [(state, target_state) for target_state in cache.TARGET_STATES]
+    queries += [(queries[0][0], "frontled calibrate"), (queries[0][0], "frontled paused")]
+    generator.shuffle(queries)
+    queries += queries[:10] # repeated
+    expected = [cache.get_cached_for_state(state, target_state) for state, target_state in queries]
+    assert any(solution is not None and len(solution) > 1 for solution in expected)
+    assert cache.get_cached_many(queries) == expected
+
+    monkeypatch.setattr(cache, "CACHE_PACK_FILE", str(tmp_path / "cache.pack"))
+    cache.write_pack()
+    assert cache.get_cached_many(queries) == expected
+    assert cache.get_cached_many([]) == []
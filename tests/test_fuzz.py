@@ -0,0 +1,35 @@
+import pytest
+
+from configuration import *
+import fuzz
+
+def test_fuzz_finds_nothing():
+    counts, failures = fuzz.fuzz(seconds=60, seed=1, cases=100)
+    assert sum(counts.values()) == 100
+    assert counts["search"] == 100 // fuzz.FUZZ_SEARCH_EVERY
+    assert failures == []
+
+def test_fuzz_shrinks_failures(monkeypatch):
+    # Forgets that dimming twice is forbidden
+    def broken(state, command):
+        successor = fuzz.reference_successor(state, command)
+        if successor is None and command == Command.FRONT_DIM:
+            return state
+        return successor
+    monkeypatch.setitem(fuzz.SUCCESSOR_ENGINES, "broken", broken)
+
+    state = read_state(State(), ["backled g2", "frontled b4", "potled smooth", "potled off", "frontled dim"])
+    mismatch = fuzz.check_successors(encode_state(state), list(COMMANDS))
+    assert mismatch is not None
+    failure = fuzz.shrink(fuzz.Failure("successors", encode_state(state), list(COMMANDS), mismatch))
+    assert failure.commands == [Command.FRONT_DIM]
+    # only the frontled needs to be in a color mode and already dimmed
+    assert decode_state(failure.state) == State(frontled_rel_brightness=2)
+    assert "frontled_rel_brightness=2" in failure.describe()
+
+def test_searches_compared(monkeypatch):
+    import solver
+    state = encode_state(read_state(State(), ["backled g2", "frontled b2", "potled r4"]))
+    assert fuzz.check_search(state, [Command.FRONT_W5_POT_FADE, Command.FRONT_ONOFF]) is None
+    monkeypatch.setattr(solver, "bfs_parallel", lambda *arguments: None)
+    assert "solver.bfs_parallel" in fuzz.check_search(state, [Command.FRONT_W5_POT_FADE, Command.FRONT_ONOFF])
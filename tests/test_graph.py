@@ -0,0 +1,66 @@
+import pytest
+import random
+
+from configuration import *
+import graph
+import solver
+
+@pytest.fixture(scope="module")
+def csr_graph(tmp_path_factory):
+    file = str(tmp_path_factory.mktemp("graph") / "graph.bin")
+    graph.save(graph.build(), file)
+    return graph.load(file)
+
+def test_edges_match_perform_command(csr_graph):
+    random.seed(0)
+    for state in random.sample(range(graph.NODE_COUNT), 200):
+        state += random.randrange(FRONTLED_CALIBRATION_LENGTH) * FRONTLED_CALIBRATION
+        decoded_state = decode_state(state)
+        expected = set()
+        for command in COMMANDS:
+            new_state = perform_command(decoded_state, command)
+            if new_state is not decoded_state and graph.in_graph(encode_state(new_state)) \
+                    and encode_state(new_state) != state:
+                expected.add((command.value, encode_state(new_state)))
+        assert set(graph.neighbours(csr_graph, state)) == expected
+
+def test_bfs(csr_graph):
+    initial_state = read_state(State(), ["backled g", "frontled b3", "potled r4"])
+    desired_state = read_state(initial_state, ["backled g3"])
+    solution = graph.bfs(csr_graph, encode_state(initial_state), encode_state(desired_state), 3)
+    assert len(solution) == 2
+    assert solver.is_solution(solution, initial_state, desired_state)
+    assert graph.bfs(csr_graph, encode_state(initial_state), encode_state(desired_state), 1) is None
+
+def test_bfs_through_calibration(csr_graph):
+    initial_state = read_state(State(), ["backled g", "frontled diy3", "potled fade", "frontled paused"])
+    desired_state = read_state(initial_state, ["frontled calibrate"])
+    solution = graph.bfs(csr_graph, encode_state(initial_state), encode_state(desired_state), 10)
+    assert len(solution) == 4
+    assert solver.is_solution(solution, initial_state, desired_state)
+
+def test_bfs_reuses_search_tree(csr_graph):
+    initial_state = read_state(State(), ["backled r", "frontled diy6", "potled g"])
+    state = encode_state(initial_state)
+    expected = {}
+    for target in ["backled g3", "frontled b2", "potled r4", "backled w"]:
+        graph._search_trees.clear()
+        expected[target] = graph.bfs(csr_graph, state, encode_state(read_state(initial_state, [target])), 3)
+    graph._search_trees.clear()
+    # interrupted by the deadline, after which the search continues
+    with pytest.raises(solver.DeadlineExceeded):
+        graph.bfs(csr_graph, state, encode_state(read_state(initial_state, ["backled w"])), 3, 0)
+    for target, solution in expected.items():
+        desired_state = read_state(initial_state, [target])
+        assert graph.bfs(csr_graph, state, encode_state(desired_state), 3) == solution
+        assert len(graph._search_trees) == 1
+    assert graph.bfs(csr_graph, state, encode_state(read_state(initial_state, ["backled w"])), 1) is None
+
+def test_graph_of_another_model_ignored(tmp_path):
+    from array import array
+    import transitions
+    file = tmp_path / "graph.bin"
+    graph.save(graph.Graph(memoryview(array('q', [0, 0])), memoryview(array('i')), memoryview(b"")), str(file))
+    assert file.read_bytes()[:8] == transitions.model_fingerprint()
+    file.write_bytes(bytes(8) + file.read_bytes()[8:])
+    assert graph.load(str(file)) is None
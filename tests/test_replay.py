@@ -0,0 +1,23 @@
+import json
+import pytest
+
+import cache
+import main
+import replay
+
+def test_replay(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "JOURNAL_MISSES", False)
+    log = tmp_path / "workload.jsonl"
+    log.write_text("\n".join(json.dumps(request) for request in [
+        {"initial": "backled r, frontled g5, potled r", "desired": "backled w", "flags": ["--use-cache"]},
+        {"initial": "backled g, frontled b3, potled r4, backled off", "desired": "backled off"},
+        {"initial": "backled g, frontled b3, potled r4", "desired": "frontled b", "flags": ["--deadline-ms", "1000"]},
+        {"initial": "backled g, frontled b3", "desired": "backled r"},
+    ]) + "\n")
+    report = replay.replay(main.read_workload_log(str(log)), rate=20)
+    assert [result.source for result in report.results] == ["cache", "unchanged", "search", None]
+    assert report.errors() == {"Define all modes": 1}
+    assert report.sources() == {"cache": 1, "unchanged": 1, "search": 1}
+    assert sum(report.histogram()) == 4
+    assert report.elapsed_s >= 3 / 20 # paced by the rate
+    assert report.percentile(0) <= report.percentile(50) <= report.percentile(100)
@@ -0,0 +1,65 @@
+import pytest
+
+from configuration import *
+from solver import bfs, bfs_parallel
+
+def test_parallel_matches_sequential():
+    state = read_state(State(), ["backled g", "frontled b3", "potled r4"])
+    for target in [["backled g3"], ["potled g4"], ["frontled off", "backled w"]]:
+        desired_state = read_state(state, target)
+        assert bfs_parallel(state, desired_state, 2, 3) == bfs(state, desired_state, 2)
+
+def test_exhausted_search_ends(monkeypatch):
+    import sys
+    import time
+    import transitions
+    state = read_state(State(), ["backled g", "frontled b3", "potled r4"])
+    # nothing is reachable, so the search has to end without a deadline to stop it
+    monkeypatch.setattr(transitions, "applicable_mask", lambda decoded_state: 0)
+    assert bfs(state, read_state(state, ["backled g3"]), sys.maxsize, time.monotonic() + 3600) is None
+
+def test_parallel_deadline():
+    import time
+    import solver
+    state = read_state(State(), ["backled g2", "frontled b2", "potled r4"])
+    desired_state = read_state(state, ["frontled w5"])
+    with pytest.raises(solver.DeadlineExceeded):
+        bfs_parallel(state, desired_state, 3, 2, time.monotonic())
+    # the workers left mid-level are replaced
+    assert bfs_parallel(state, desired_state, 1, 2) is None
+    target = read_state(state, ["frontled b"])
+    assert bfs_parallel(state, target, 2, 2) == bfs(state, target, 2)
+
+def test_parallel_matches_sequential_deeper():
+    import solver
+    queries = [(["backled b4", "frontled w", "potled b3", "backled off", "frontled off", "potled off"], "frontled diy5 rdown"),
+               (["backled smooth", "frontled w4", "potled g3", "backled off", "frontled off", "potled off"], "frontled diy6 bup")]
+    for initial_state, target in queries:
+        state = read_state(State(), initial_state)
+        desired_state = read_state(state, [target])
+        sequential = bfs(state, desired_state, 5)
+        parallel = bfs_parallel(state, desired_state, 5, 2)
+        assert len(sequential) == 5 # deep enough for partial-order reduction to prune along the way
+        assert len(parallel) == len(sequential)
+        assert solver.is_solution(parallel, state, desired_state)
+
+def test_parallel_admits_every_edge_to_a_state():
+    import multiprocessing
+    from array import array
+    import solver
+    connection, worker_connection = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=solver._bfs_worker, args=(worker_connection, 1), daemon=True)
+    process.start()
+    try:
+        connection.send(("start", None))
+        state = encode_state(read_state(State(), ["backled g", "frontled b3", "potled r4"]))
+        # reached from two nodes of the level, the latter with a command that partial-order reduction may still need
+        edges = [1 * len(COMMANDS) + Command.BACK_ON.value, 2 * len(COMMANDS) + Command.FRONT_B3.value]
+        connection.send(("admit", [(array('q', [state, state]), array('q', edges))]))
+        states, admitted_edges, found = connection.recv()
+    finally:
+        process.terminate()
+        process.join()
+    assert list(states) == [state, state]
+    assert list(admitted_edges) == edges
+    assert found is None
@@ -0,0 +1,35 @@
+import pytest
+
+from configuration import *
+import main
+import service
+
+def test_session():
+    service.resync("test", "backled g, frontled b3, potled r4")
+    assert service.plan("test", "backled g3", True).commands == [Command.BACK_G3_FRONT_DIY2, Command.FRONT_B3]
+    assert describe_state(service.current_state("test")) == ["backled g3", "frontled b3", "potled r4"]
+    # continues from where the previous solution left off
+    assert service.plan("test", "frontled bright", True).commands == [Command.FRONT_BRIGHTEN]
+    # only the absolute part is remembered, so the same relative target is planned again
+    assert service.current_state("test") == read_state(State(), ["backled g3", "frontled b3", "potled r4"])
+    assert service.plan("test", "frontled bright", True).commands == [Command.FRONT_BRIGHTEN]
+    # and the cache still answers from the session
+    assert service.plan("test", "frontled w5", True).source == "cache"
+    assert service.plan("test", "frontled b3", True).commands is not None
+    assert service.plan("test", "frontled off", True).commands == [Command.FRONT_ONOFF]
+    assert service.current_state("test") == read_state(State(), ["backled g3", "frontled b3", "potled r4", "frontled off"])
+    service.resync("test", "backled g, frontled b3, potled r4, frontled off")
+    assert service.plan("test", "frontled on", True).commands == [Command.FRONT_ONOFF]
+    service.close("test")
+    with pytest.raises(main.InvalidParameters):
+        service.plan("test", "frontled on")
+
+def test_protocol():
+    assert service.handle_request("resync test backled r, frontled g, potled b\n") == \
+        {"state": ["backled r", "frontled g", "potled b"]}
+    assert service.handle_request("plan test frontled b") == \
+        {"commands": ["frontled b"], "optimal": True, "source": "search",
+         "state": ["backled r", "frontled b", "potled b"]}
+    assert "error" in service.handle_request("plan test frontled x")
+    assert "error" in service.handle_request("plan other frontled b")
+    assert service.handle_request("close test") == {}
@@ -1,6 +1,6 @@
 import pytest
 
-from main import solve_command_series
+from main import solve_command_series, solve_command_series_with_report
 from configuration import Command
 
 USE_CACHE = True
@@ -89,4 +89,69 @@ def test_would_be_slow_without_cache_device_toggling_optimization():
         [Command.FRONT_W5_POT_FADE,
          Command.FRONT_ONOFF,
          Command.FRONT_G5_POT_R4,
-         Command.FRONT_ONOFF]
\ No newline at end of file
+         Command.FRONT_ONOFF]
+
+def test_deadline():
+    solution = solve_command_series_with_report("backled g2, frontled b2, potled r4", "frontled w5", deadline_ms=0)
+    assert solution.commands == \
+        [Command.FRONT_W5_POT_FADE,
+         Command.FRONT_ONOFF,
+         Command.FRONT_G5_POT_R4,
+         Command.FRONT_ONOFF]
+    assert not solution.optimal
+
+    solution = solve_command_series_with_report("backled g, frontled b3, potled r4", "backled g3", deadline_ms=10000)
+    assert solution.commands == \
+        [Command.BACK_G3_FRONT_DIY2,
+         Command.FRONT_B3]
+    assert solution.optimal
+
+    # a cached solution is returned right away
+    solution = solve_command_series_with_report("backled g2, frontled b2, potled r4", "frontled w5", USE_CACHE,
+                                                deadline_ms=10000)
+    assert solution.source == "cache"
+    assert len(solution.commands) == 4
+
+def test_compound():
+    from configuration import State, read_state
+    from solver import is_solution
+    initial = "backled b5, frontled g2, potled r2"
+    desired = "frontled off, backled g3, potled b2"
+    solution = solve_command_series(initial, desired, USE_CACHE)
+    assert solution is not None
+    decoded_initial_state = read_state(State(), initial.split(", "))
+    assert is_solution(solution, decoded_initial_state, read_state(decoded_initial_state, desired.split(", ")))
+
+def test_playlist():
+    from main import solve_playlist
+    solutions = solve_playlist("backled r, frontled g, potled b", ["frontled b", "backled off", "frontled b"], USE_CACHE)
+    assert [solution.commands for solution in solutions] == \
+        [[Command.FRONT_B],
+         [Command.BACK_OFF],
+         []]
+    assert solutions[1].commands == solve_command_series("backled r, frontled b, potled b", "backled off", USE_CACHE)
+
+def test_special_targets():
+    from configuration import POTLED_CALIBRATION_PHASE
+    assert solve_command_series("backled r, frontled g2, potled r2", "frontled paused", USE_CACHE) == \
+        [Command.FRONT_PLAYPAUSE]
+    assert solve_command_series("backled r, frontled g2, potled r2, frontled paused", "frontled paused", USE_CACHE) == []
+    assert solve_command_series("backled r, frontled g2, potled r2", "frontled calibrate", USE_CACHE) == \
+        [Command.FRONT_ONOFF,
+         Command.FRONT_FADE7_POT_ON,
+         Command.FRONT_ONOFF]
+    assert solve_command_series("backled r, frontled g2, potled r2", "potled calibrate", USE_CACHE) == \
+        POTLED_CALIBRATION_PHASE + \
+        [Command.FRONT_DIY2_POT_R2,
+         Command.FRONT_G2]
+
+def test_failed_calibration_plan_is_a_copy(monkeypatch):
+    from configuration import POTLED_CALIBRATION_PHASE, State, read_state
+    import solver
+    calibration_phase = list(POTLED_CALIBRATION_PHASE)
+    monkeypatch.setattr(solver, "solve_internal", lambda state, endstate, deadline=None: None) # can't return
+    state = read_state(State(), ["backled r", "frontled g2", "potled r2"])
+    plan = solver.handle_special_case(state, read_state(state, ["potled calibrate"]))
+    assert plan == calibration_phase
+    plan.append(Command.FRONT_G2)
+    assert POTLED_CALIBRATION_PHASE == calibration_phase
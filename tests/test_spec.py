@@ -0,0 +1,82 @@
+import json
+import pytest
+
+from configuration import *
+import spec
+
+def test_spec_reproduces_commands_and_layout():
+    model = spec.load()
+    assert [name for name, _, _ in model.commands] == [command.name for command in Command]
+    assert [(executable, side_effect) for _, executable, side_effect in model.commands] == list(COMMANDS.values())
+    assert [command.value for command in model.command_enum()] == [command.value for command in Command]
+    assert model.modes == {"backled": BACKLED_MODES, "frontled": FRONTLED_MODES, "potled": POTLED_MODES}
+    assert model.color_modes == {"backled": BACKLED_COLOR_MODES, "frontled": FRONTLED_COLOR_MODES,
+                                 "potled": POTLED_COLOR_MODES}
+    assert model.relative_changes_exclusive == AVOID_CHANGING_RELATIVE_STATE_NEEDLESSLY
+    assert model.state_max_size() == STATE_MAX_SIZE
+    assert model.position("frontled_diy3_rel_rgb") == FRONTLED_DIY3_REL_RGB
+    assert model.position("frontled_calibration") == FRONTLED_CALIBRATION
+
+def test_spec_reproduces_perform_command():
+    mismatch, _, _ = spec.check(spec.load(), 300)
+    assert mismatch is None
+
+def test_spec_relative_changes():
+    model = spec.load()
+    state = read_state(State(), ["backled r", "frontled diy2", "potled smooth"])
+    encoded = encode_state(state)
+    raised = model.successor(encoded, Command.BACK_R5_FRONT_RUP.value)
+    assert raised == encode_state(perform_command(state, Command.BACK_R5_FRONT_RUP))
+    assert decode_state(raised).frontled_diy2_rel_rgb == 1
+    assert model.successor(raised, Command.FRONT_RUP_POT_G3.value) is None # already raised
+    assert model.successor(raised, Command.FRONT_RDOWN_POT_G5.value) is None # can't tell if the raise had any effect
+
+def test_spec_errors():
+    definition = spec.load_spec()
+    definition["layout"] = definition["layout"][:-1]
+    with pytest.raises(ValueError):
+        spec.compile_spec(definition)
+    definition = spec.load_spec()
+    definition["commands"][0]["executable"] = "frontled nonexistent"
+    with pytest.raises(ValueError):
+        spec.compile_spec(definition)
+
+def test_transitions_follow_spec(monkeypatch):
+    import transitions
+    def clear_tables():
+        for table in [transitions.device_transitions, transitions.device_steps, transitions._device_masks]:
+            table.cache_clear()
+    definition = spec.load_spec()
+    definition["devices"]["frontled"]["buttons"]["bright"]["to"] = 2 # brightens like dimming
+    monkeypatch.setattr(spec, "_loaded", (spec.SPEC_FILE, spec.compile_spec(definition)))
+    clear_tables()
+    try:
+        state = read_state(State(), ["backled r", "frontled g", "potled b"])
+        values = transitions.device_values("frontled", state)
+        dimmed = transitions.device_steps("frontled", values)[Command.FRONT_DIM.value]
+        assert transitions.device_steps("frontled", values)[Command.FRONT_BRIGHTEN.value] == dimmed
+        assert not transitions.replays_to([Command.FRONT_BRIGHTEN], state, read_state(state, ["frontled bright"]))
+    finally:
+        clear_tables()
+
+def test_mismatching_spec_refused(tmp_path, monkeypatch):
+    definition = spec.load_spec()
+    definition["devices"]["frontled"]["buttons"]["bright"]["to"] = 2 # brightens like dimming
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps(definition))
+    monkeypatch.setattr(spec, "_loaded", None)
+    with pytest.raises(ValueError):
+        spec.load(str(path))
+    assert spec._loaded is None
+
+def test_fingerprint_covers_perform_command(monkeypatch):
+    import transitions
+    def perform_brighten_as_dim(state, command):
+        return perform_command(state, Command.FRONT_DIM if command == Command.FRONT_BRIGHTEN else command)
+    fingerprint = transitions.model_fingerprint()
+    monkeypatch.setattr(transitions, "perform_command", perform_brighten_as_dim)
+    transitions.model_fingerprint.cache_clear()
+    try:
+        assert transitions.model_fingerprint() != fingerprint
+    finally:
+        transitions.model_fingerprint.cache_clear()
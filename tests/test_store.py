@@ -0,0 +1,58 @@
+import pytest
+
+from configuration import Command
+import store
+
+@pytest.fixture
+def store_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "STORE_FILE", str(tmp_path / "store.sqlite3"))
+    return tmp_path / "store.sqlite3"
+
+def test_better_solutions_replace_worse(store_file):
+    assert store.get_stored(1, 2) is None
+    store.store_solution(1, 2, [Command.FRONT_R, Command.FRONT_G, Command.FRONT_B], False)
+    store.store_solution(1, 2, [Command.FRONT_R, Command.FRONT_G, Command.FRONT_B, Command.FRONT_W], False)
+    assert store.get_stored(1, 2) == ([Command.FRONT_R, Command.FRONT_G, Command.FRONT_B], False)
+    store.store_solution(1, 2, [Command.FRONT_G, Command.FRONT_B], True)
+    store.store_solution(1, 2, [Command.FRONT_B], False) # not proven, the optimal one stays
+    assert store.get_stored(1, 2) == ([Command.FRONT_G, Command.FRONT_B], True)
+
+def test_least_recently_used_evicted(store_file, monkeypatch):
+    monkeypatch.setattr(store, "STORE_MAX_SOLUTIONS", 2)
+    store.store_solution(1, 2, [Command.FRONT_R], True)
+    store.store_solution(3, 4, [Command.FRONT_G], True)
+    store.get_stored(1, 2)
+    store.store_solution(5, 6, [Command.FRONT_B], True)
+    assert store.get_stored(3, 4) is None
+    assert store.get_stored(1, 2) is not None
+    assert store.get_stored(5, 6) is not None
+
+def test_solutions_of_another_model_removed(store_file, monkeypatch):
+    import transitions
+    store.store_solution(1, 2, [Command.FRONT_R], True)
+    fingerprint = transitions.model_fingerprint()
+    monkeypatch.setattr(store, "_connection", None) # opened again, as in another process
+    assert store.get_stored(1, 2) == ([Command.FRONT_R], True)
+
+    monkeypatch.setattr(store, "_connection", None)
+    monkeypatch.setattr(transitions, "model_fingerprint", lambda: bytes(8))
+    assert store.get_stored(1, 2) is None
+    store.store_solution(3, 4, [Command.FRONT_G], True)
+    monkeypatch.setattr(store, "_connection", None)
+    assert store.get_stored(3, 4) == ([Command.FRONT_G], True)
+
+    monkeypatch.setattr(store, "_connection", None)
+    monkeypatch.setattr(transitions, "model_fingerprint", lambda: fingerprint)
+    assert store.get_stored(3, 4) is None
+
+def test_solve_uses_store(store_file):
+    from main import solve_command_series_with_report
+    solution = solve_command_series_with_report("backled g, frontled b3, potled r4", "backled g3", use_store=True)
+    assert store.get_stored(*_encoded("backled g, frontled b3, potled r4", "backled g3")) == \
+        (solution.commands, solution.optimal)
+    assert solve_command_series_with_report("backled g, frontled b3, potled r4", "backled g3", use_store=True) == solution
+
+def _encoded(initial: str, desired: str) -> tuple[int, int]:
+    from configuration import State, read_state, encode_state
+    decoded_initial_state = read_state(State(), initial.split(", "))
+    return encode_state(decoded_initial_state), encode_state(read_state(decoded_initial_state, desired.split(", ")))
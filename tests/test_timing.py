@@ -0,0 +1,28 @@
+import pytest
+
+from configuration import *
+from main import solve_fastest
+import solver
+import timing
+
+def test_schedule():
+    plan = timing.schedule([Command.BACK_G3_FRONT_DIY2, Command.BACK_OFF, Command.FRONT_B3])
+    # the backled has to cool down before BACK_OFF, the frontled only before FRONT_B3
+    assert plan.start_ms == [0, timing.TRANSMIT_MS + timing.DEVICE_COOLDOWN_MS["backled"],
+                             2 * timing.TRANSMIT_MS + timing.DEVICE_COOLDOWN_MS["backled"]]
+    assert plan.total_ms == plan.start_ms[-1] + timing.TRANSMIT_MS
+
+def test_fastest():
+    # a generous deadline so that the search gets to finish even under load, unlike in FASTEST_SEARCH_MS
+    plan = solve_fastest("backled r, frontled g, potled b", "frontled b, backled g, potled r", True, 120000)
+    initial_state = read_state(State(), ["backled r", "frontled g", "potled b"])
+    assert solver.is_solution(plan.commands, initial_state, read_state(initial_state, ["frontled b", "backled g", "potled r"]))
+    assert plan.optimal
+    assert plan == timing.schedule(plan.commands, optimal=True)
+    shortest = solver.solve(["backled r", "frontled g", "potled b"], ["frontled b", "backled g", "potled r"], True)
+    assert plan.total_ms <= timing.schedule(shortest).total_ms
+
+def test_fastest_calibration_is_scheduled():
+    plan = solve_fastest("backled r, frontled g, potled b", "potled calibrate", True)
+    assert plan.commands[:len(POTLED_CALIBRATION_PHASE)] == POTLED_CALIBRATION_PHASE
+    assert plan.total_ms == timing.schedule(plan.commands).total_ms
@@ -0,0 +1,70 @@
+import pytest
+
+from configuration import *
+from transitions import SuccessorMemo, command_footprint, are_independent, applicable_mask, commands_in_mask
+
+def test_memo_matches_perform_command():
+    memo = SuccessorMemo(1000)
+    state = read_state(State(), ["backled g2", "frontled diy1", "potled strobe"])
+    encoded = encode_state(state)
+    for command in COMMANDS:
+        expected = encode_state(perform_command(state, command))
+        assert memo.successor(encoded, state, command) == expected
+        assert memo.successor(encoded, state, command) == expected
+    assert memo.hits == len(COMMANDS)
+    assert memo.misses == len(COMMANDS)
+    assert memo.hit_rate() == 0.5
+
+def test_memo_eviction():
+    memo = SuccessorMemo(2)
+    state = State()
+    encoded = encode_state(state)
+    memo.successor(encoded, state, Command.FRONT_R)
+    memo.successor(encoded, state, Command.FRONT_G)
+    memo.successor(encoded, state, Command.FRONT_R) # most recently used again
+    memo.successor(encoded, state, Command.FRONT_B)
+    assert len(memo.transitions) == 2
+    memo.successor(encoded, state, Command.FRONT_R)
+    assert memo.hits == 2
+    memo.successor(encoded, state, Command.FRONT_G)
+    assert memo.misses == 4
+
+def test_footprint():
+    assert command_footprint(Command.FRONT_R) == ({"frontled_on"}, {"frontled_mode"})
+    assert command_footprint(Command.BACK_ON) == (set(), {"backled_on"})
+    reads, writes = command_footprint(Command.BACK_R5_FRONT_RUP)
+    assert "potled_mode" not in writes and "backled_mode" in writes
+
+def test_independent_commands_commute():
+    import random
+    rng = random.Random(0)
+    pairs = [(c1, c2) for c1 in COMMANDS for c2 in COMMANDS if c1.value < c2.value and are_independent(c1, c2)]
+    assert (Command.FRONT_R, Command.BACK_ON) in pairs
+    for _ in range(200):
+        state = State(backled_on=rng.randint(0, 1), frontled_on=rng.randint(0, 1), potled_on=rng.randint(0, 1),
+                      backled_mode=rng.randrange(BACKLED_MODE_LENGTH),
+                      frontled_mode=rng.randrange(FRONTLED_MODE_LENGTH),
+                      potled_mode=rng.randrange(POTLED_MODE_LENGTH))
+        for c1, c2 in rng.sample(pairs, 20):
+            assert perform_command(perform_command(state, c1), c2) == perform_command(perform_command(state, c2), c1)
+
+def test_applicability_index():
+    import random
+    rng = random.Random(1)
+    for _ in range(300):
+        state = decode_state(rng.randrange(STATE_MAX_SIZE))
+        expected = tuple(c for c in COMMANDS if perform_command(state, c) != state)
+        assert commands_in_mask(applicable_mask(state)) == expected
+
+def test_footprint_of_command_missing_from_spec(monkeypatch):
+    import spec
+    definition = spec.load_spec()
+    definition["commands"][Command.FRONT_R.value]["name"] = "FRONT_RED"
+    monkeypatch.setattr(spec, "_loaded", (spec.SPEC_FILE, spec.compile_spec(definition)))
+    command_footprint.cache_clear()
+    try:
+        with pytest.raises(ValueError):
+            command_footprint(Command.FRONT_R)
+        assert command_footprint(Command.BACK_ON) == (set(), {"backled_on"})
+    finally:
+        command_footprint.cache_clear()
@@ -0,0 +1,232 @@
+"""
+Wall-clock cost model for executing solutions, and a search for the solution
+that gets the devices to the desired state in the least time rather than in
+the fewest commands.
+
+Transmitting a command takes TRANSMIT_MS (or its COMMAND_TRANSMIT_MS), one
+command at a time. A device that received a command needs DEVICE_COOLDOWN_MS
+after the end of the transmission before it reliably receives the next one,
+so a command has to wait for the cooldowns of the devices it's meant for (the
+executable and the side-effect, see COMMANDS). Commands for other devices can
+be sent meanwhile. The time taken by a solution is the end of its last
+transmission when each command is sent as early as possible (see schedule).
+
+Note: the fastest solution is sought among the ones at most
+      FASTEST_EXTRA_COMMANDS longer than the shortest one. Any longer ones
+      would rarely be faster, but would make the search much slower.
+
+Also note: the defaults are rough figures for NEC-style remotes. Measure the
+           devices at hand for better plans.
+"""
+
+from configuration import *
+import functools
+import transitions
+
+# Time to transmit a command in milliseconds, unless given in COMMAND_TRANSMIT_MS:
+TRANSMIT_MS = 110
+# Transmit times of specific commands in milliseconds:
+COMMAND_TRANSMIT_MS: dict[Command, int] = {}
+# Time a device needs after receiving a command before it reliably receives the next one:
+DEVICE_COOLDOWN_MS = {"backled": 300, "frontled": 300, "potled": 300}
+# Solutions up to this many commands longer than the shortest one are considered for the fastest one:
+FASTEST_EXTRA_COMMANDS = 1
+# Devices with more states than this within reach are only told apart by being in the desired state or not
+# while searching for the fastest solution (see _device_distances):
+DEVICE_DISTANCE_STATES = 2000
+# Time to search for the fastest solution unless a deadline is given, after which the fastest found by then is used:
+FASTEST_SEARCH_MS = 2000
+
+# A solution along with when to send each command, in milliseconds from the
+# start, and when the last transmission ends. Optimal if proven the fastest
+# of the solutions considered (see fastest).
+@dataclasses.dataclass
+class Plan:
+    commands: list[Command] | None
+    start_ms: list[int] = dataclasses.field(default_factory=list)
+    total_ms: int = 0
+    optimal: bool = False
+
+def transmit_ms(command: Command) -> int:
+    return COMMAND_TRANSMIT_MS.get(command, TRANSMIT_MS)
+
+# Indices of the devices in transitions.DEVICES the command is meant for
+@functools.cache
+def command_devices(command: Command) -> tuple[int, ...]:
+    executable, side_effect = COMMANDS[command]
+    devices = {effect.split(" ")[0] for effect in [executable, side_effect] if effect is not None}
+    return tuple(i for i, device in enumerate(transitions.DEVICES) if device in devices)
+
+def _cooldowns() -> tuple[int, ...]:
+    return tuple(DEVICE_COOLDOWN_MS[device] for device in transitions.DEVICES)
+
+# Sends the command after the given waits, relative to the end of the previous
+# transmission, have passed for its devices. Returns when it's sent, how long
+# it took from the end of the previous transmission and the waits after it.
+def _send(command: Command, waits: tuple[int, ...], cooldowns: tuple[int, ...]) -> tuple[int, int, tuple[int, ...]]:
+    devices = command_devices(command)
+    start = max(waits[i] for i in devices)
+    elapsed = start + transmit_ms(command)
+    return start, elapsed, tuple(cooldowns[i] if i in devices else max(0, wait - elapsed) for i, wait in enumerate(waits))
+
+# The plan of sending the commands in order, each as early as possible
+def schedule(commands: list[Command] | None, optimal: bool = False) -> Plan:
+    if commands is None:
+        return Plan(None)
+    cooldowns = _cooldowns()
+    waits = (0,) * len(cooldowns)
+    start_ms = []
+    total = 0
+    for command in commands:
+        start, elapsed, waits = _send(command, waits, cooldowns)
+        start_ms.append(total + start)
+        total += elapsed
+    return Plan(list(commands), start_ms, total, optimal)
+
+# A* search for the fastest solution from state to endstate among the ones at
+# most FASTEST_EXTRA_COMMANDS longer than the given shortest one. The search is
+# quicker if that one is known to be the shortest possible. The nodes are the
+# device states with the waits still left for each device, as the time each
+# command takes depends on the commands sent before it. The deadline is
+# given in terms of time.monotonic(); when it passes the fastest plan found by
+# then is returned. Without a deadline the search takes FASTEST_SEARCH_MS.
+def fastest(state: State, endstate: State, shortest: list[Command], shortest_is_optimal: bool = False,
+            deadline: float | None = None) -> Plan:
+    import heapq
+    import itertools
+    import time
+
+    if deadline is None:
+        deadline = time.monotonic() + FASTEST_SEARCH_MS / 1000
+    best = schedule(shortest)
+    max_length = len(shortest) + FASTEST_EXTRA_COMMANDS
+    values = tuple(transitions.device_values(device, state) for device in transitions.DEVICES)
+    end_values = tuple(transitions.device_values(device, endstate) for device in transitions.DEVICES)
+    if values == end_values:
+        return Plan([], optimal=True)
+    distances = [_device_distances(device, start, end, max_length)
+                 for device, start, end in zip(transitions.DEVICES, values, end_values)]
+    cooldowns = _cooldowns()
+    fastest_transmit = min(transmit_ms(command) for command in COMMANDS)
+
+    # Commands that are meant for the same devices are alike in how they can be
+    # scheduled, only the fastest of each kind matters for the lower bounds
+    kinds: dict[tuple[int, ...], Command] = {}
+    for command in COMMANDS:
+        devices = command_devices(command)
+        if devices not in kinds or transmit_ms(command) < transmit_ms(kinds[devices]):
+            kinds[devices] = command
+
+    # Least time to send any steps commands after the given waits
+    @functools.cache
+    def least_time(steps: int, waits: tuple[int, ...]) -> int:
+        if steps == 0:
+            return 0
+        return min(elapsed + least_time(steps - 1, next_waits)
+                   for _, elapsed, next_waits in (_send(command, waits, cooldowns) for command in kinds.values()))
+
+    # Lower bounds for the commands and the time still needed after length
+    # commands: each device has to receive at least as many commands as it's
+    # away from its desired state, and if the shortest solution is proven the
+    # shortest, no state on the way is any closer to the desired state than
+    # that allows. None if the desired state can't be reached within max_length.
+    def remaining(values: tuple, waits: tuple[int, ...], length: int) -> tuple[int, int] | None:
+        steps = max(0, len(shortest) - length) if shortest_is_optimal else 0
+        bound = 0
+        for distance, device_values, end, wait, cooldown in zip(distances, values, end_values, waits, cooldowns):
+            device_steps = distance.get(device_values) if distance is not None else int(device_values != end)
+            if device_steps is None:
+                return None
+            if device_steps > 0:
+                steps = max(steps, device_steps)
+                bound = max(bound, wait + device_steps * fastest_transmit + (device_steps - 1) * cooldown)
+        if length + steps > max_length:
+            return None
+        return steps, max(bound, least_time(steps, waits))
+
+    counter = itertools.count()
+    start_node = (values, (0,) * len(cooldowns), 0)
+    left = remaining(values, start_node[1], 0)
+    if left is None:
+        return best
+    # node -> (parent node, command, when it's sent)
+    parents: dict[tuple, tuple[tuple, Command, int] | None] = {start_node: None}
+    costs = {start_node: 0}
+    queue = [(left[1], 0, next(counter), start_node)]
+    while queue:
+        if time.monotonic() > deadline:
+            return best
+        estimated, cost, _, node = heapq.heappop(queue)
+        if estimated >= best.total_ms:
+            break
+        if cost > costs[node]:
+            continue
+        values, waits, length = node
+        tables = [transitions.device_steps(device, device_values)
+                  for device, device_values in zip(transitions.DEVICES, values)]
+        for command in COMMANDS:
+            next_values = tuple(table[command.value] for table in tables)
+            if None in next_values or next_values == values:
+                continue # forbidden or changes nothing
+            start, elapsed, next_waits = _send(command, waits, cooldowns)
+            left = remaining(next_values, next_waits, length + 1)
+            if left is None:
+                continue
+            next_node = (next_values, next_waits, length + 1)
+            next_cost = cost + elapsed
+            if next_cost + left[1] >= best.total_ms or next_cost >= costs.get(next_node, next_cost + 1):
+                continue
+            costs[next_node] = next_cost
+            parents[next_node] = (node, command, cost + start)
+            if next_values == end_values:
+                best = _trace_plan(parents, next_node, next_cost)
+                continue
+            heapq.heappush(queue, (next_cost + left[1], next_cost, next(counter), next_node))
+    best.optimal = True
+    return best
+
+def _trace_plan(parents: dict, node: tuple, total: int) -> Plan:
+    commands = []
+    start_ms = []
+    while (parent := parents[node]) is not None:
+        node, command, start = parent
+        commands.append(command)
+        start_ms.append(start)
+    return Plan(commands[::-1], start_ms[::-1], total)
+
+# Least amount of commands from each device state to the end values, for the
+# device states within max_length commands from the start values. Only
+# commands that change the device count, and every command the device allows
+# is taken regardless of the other devices, so these are lower bounds. None if
+# there are more than DEVICE_DISTANCE_STATES such device states, as finding
+# the steps from each of them would take longer than it saves.
+def _device_distances(device: str, start: tuple[int, ...], end: tuple[int, ...],
+                      max_length: int) -> dict[tuple[int, ...], int] | None:
+    predecessors: dict[tuple[int, ...], set[tuple[int, ...]]] = {start: set()}
+    frontier = [start]
+    for _ in range(max_length):
+        next_frontier = []
+        for values in frontier:
+            for step in transitions.device_steps(device, values):
+                if step is None or step == values:
+                    continue
+                if step not in predecessors:
+                    if len(predecessors) == DEVICE_DISTANCE_STATES:
+                        return None
+                    predecessors[step] = set()
+                    next_frontier.append(step)
+                predecessors[step].add(values)
+        frontier = next_frontier
+    distances: dict[tuple[int, ...], int] = {}
+    if end in predecessors:
+        distances[end] = 0
+        frontier = [end]
+        while frontier:
+            next_frontier = []
+            for values in frontier:
+                for predecessor in predecessors[values]:
+                    if predecessor not in distances:
+                        distances[predecessor] = distances[values] + 1
+                        next_frontier.append(predecessor)
+            frontier = next_frontier
+    return distances
@@ -0,0 +1,250 @@
+"""
+Lookup structures that speed up traversing the graph. The transitions are
+looked up from the tables compiled from the spec of the devices (see spec.py
+and devices.json) instead of calling perform_command. The two are separate
+models of the devices: spec.load refuses a spec that is found to differ from
+perform_command, and model_fingerprint covers both (see also spec.check and
+fuzz.py). Nothing here changes which edges exist, only how quickly they are
+found.
+
+Note: everything here works on encoded states (see encode_state) as those are
+      cheap to hash and compare.
+"""
+
+from collections import OrderedDict
+from configuration import *
+import functools
+import operator
+import spec
+
+# Upper bound for the amount of transitions remembered across searches:
+SUCCESSOR_MEMO_SIZE = 1 << 19
+
+# Remembers (encoded state, command) -> encoded successor. The memo is shared
+# by every search in the process, so e.g. the neighbourhood of the default
+# state only ever needs to be computed once. Least recently used transitions
+# are evicted first.
+class SuccessorMemo:
+    def __init__(self, size: int):
+        self.size = size
+        self.transitions: OrderedDict[int, int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def successor(self, state: int, decoded_state: State, command: Command) -> int:
+        key = state * len(COMMANDS) + command.value
+        next_state = self.transitions.get(key)
+        if next_state is not None:
+            self.hits += 1
+            self.transitions.move_to_end(key)
+            return next_state
+        self.misses += 1
+        next_state = spec.load().successor(state, command.value)
+        if next_state is None: # a forbidden move changes nothing
+            next_state = state
+        self.transitions[key] = next_state
+        if len(self.transitions) > self.size:
+            self.transitions.popitem(last=False)
+        return next_state
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def clear(self):
+        self.transitions.clear()
+        self.hits = 0
+        self.misses = 0
+
+SUCCESSOR_MEMO = SuccessorMemo(SUCCESSOR_MEMO_SIZE)
+
+def successor(state: int, decoded_state: State, command: Command) -> int:
+    return SUCCESSOR_MEMO.successor(state, decoded_state, command)
+
+# Partial-order reduction: many commands touch disjoint parts of the state
+# (e.g. BACK_ON and FRONT_R), in which case either order of performing them
+# leads to the same state. Only one canonical order of such commands needs to
+# be explored: the one in which the command values are ascending. Any series of
+# commands can be reordered into the canonical one by swapping neighbouring
+# independent commands, so no state becomes any further than it was.
+
+# The fields of State that the command reads and writes, as told by the spec
+# (see spec.py) that perform_command is checked against. A field is written if
+# the command changes it in some state of the device, and read if what the
+# command does depends on it other than by leaving or replacing it, e.g.
+# toggling reads the field but setting it doesn't. The fields of relative
+# changes and cycled fields are both read and written.
+@functools.cache
+def command_footprint(command: Command) -> tuple[frozenset[str], frozenset[str]]:
+    model = spec.load()
+    if command.value >= len(model.commands) or model.commands[command.value][0] != command.name:
+        raise ValueError("No such command in the spec: " + command.name)
+    reads: set[str] = set()
+    writes: set[str] = set()
+    for table in model.tables:
+        fields = [_field_at(model, position) for position, _, _ in table.key_fields]
+        # (values of the key fields, values after the command, relative change, cycle) by key
+        outcomes = []
+        for key, (delta, adjust, cycle) in enumerate(table.entries[command.value]):
+            values = [key // stride % length for _, length, stride in table.key_fields]
+            changed = sum(value * position for value, (position, _, _) in zip(values, table.key_fields)) + delta
+            new_values = [changed // position % length for position, length, _ in table.key_fields]
+            outcomes.append((values, new_values, adjust, cycle))
+            writes.update(field for field, value, new_value in zip(fields, values, new_values) if new_value != value)
+            for relative in [adjust, cycle]:
+                if relative is not None:
+                    reads.add(_field_at(model, relative[0]))
+                    writes.add(_field_at(model, relative[0]))
+        # Each key is compared to the one with the field 0 and the rest the same
+        for i, (field, (_, _, stride)) in enumerate(zip(fields, table.key_fields)):
+            for key, (values, new_values, adjust, cycle) in enumerate(outcomes):
+                other_values, other_new_values, other_adjust, other_cycle = outcomes[key - values[i] * stride]
+                left = new_values[i] == values[i] and other_new_values[i] == other_values[i]
+                if (adjust, cycle) != (other_adjust, other_cycle) \
+                        or new_values[:i] + new_values[i + 1:] != other_new_values[:i] + other_new_values[i + 1:] \
+                        or new_values[i] != other_new_values[i] and not left:
+                    reads.add(field)
+                    break
+    if not writes:
+        raise ValueError("The command changes nothing in the spec: " + command.name)
+    return frozenset(reads), frozenset(writes)
+
+# The field of the encoded state the given weight is in, e.g. a trit of a field
+# holding several (see spec.py)
+def _field_at(model: spec.Model, weight: int) -> str:
+    return next(field for field, position, length in model.layout if position <= weight < position * length)
+
+def are_independent(command1: Command, command2: Command) -> bool:
+    reads1, writes1 = command_footprint(command1)
+    reads2, writes2 = command_footprint(command2)
+    return writes1.isdisjoint(reads2 | writes2) and writes2.isdisjoint(reads1 | writes1)
+
+# Commands worth trying after the given one as a bitmask of command values:
+# those that are not independent of it, or that come after it in the
+# canonical order.
+@functools.cache
+def commands_after_mask(command: Command) -> int:
+    return command_mask(c for c in COMMANDS if c.value > command.value or not are_independent(command, c))
+
+# Applicability index: in any given state a large share of the commands change
+# nothing, either because the affected devices are off or already in the
+# target mode, or because the move is forbidden. The spec treats each device
+# separately: whether a command changes a device only depends on the fields of
+# that device, and a forbidden move on any device cancels the whole command.
+# Thus the commands that change a state can be told from per-device tables
+# indexed by the fields of that device.
+
+# Upper bound for the amount of remembered device states per device:
+APPLICABILITY_INDEX_SIZE = 1 << 16
+
+DEVICES = ["backled", "frontled", "potled"]
+_DEVICE_FIELDS = {device: [field.name for field in dataclasses.fields(State) if field.name.startswith(device + "_")]
+                  for device in DEVICES}
+_DEVICE_GETTERS = {device: operator.attrgetter(*fields) for device, fields in _DEVICE_FIELDS.items()}
+
+# Bitmasks of the commands that change the given device state and of the
+# commands forbidden in it
+@functools.lru_cache(maxsize=APPLICABILITY_INDEX_SIZE)
+def _device_masks(device: str, values: tuple[int, ...]) -> tuple[int, int]:
+    part = _encode_device(device, values)
+    changing = 0
+    forbidden = 0
+    for command, successor in enumerate(device_transitions(device, values)):
+        if successor is None:
+            forbidden |= 1 << command
+        elif successor != part:
+            changing |= 1 << command
+    return changing, forbidden
+
+# The given device state after each command, in the order of command values,
+# or None where the command is forbidden. The fields that aren't encoded (see
+# encode_state) are left as they are.
+@functools.lru_cache(maxsize=APPLICABILITY_INDEX_SIZE)
+def device_steps(device: str, values: tuple[int, ...]) -> tuple[tuple[int, ...] | None, ...]:
+    layout = _device_layout(device)
+    return tuple(None if successor is None else
+                 tuple(value if placement is None else successor // placement[0] % placement[1]
+                       for value, placement in zip(values, layout))
+                 for successor in device_transitions(device, values))
+
+# The part of encode_state contributed by the given device state after each
+# command, in the order of command values, or None where the command is
+# forbidden. As the devices are encoded independently, the successor of a state
+# is the sum of these over the devices unless any of them is None.
+@functools.lru_cache(maxsize=APPLICABILITY_INDEX_SIZE)
+def device_transitions(device: str, values: tuple[int, ...]) -> tuple[int | None, ...]:
+    return tuple(spec.load().device_successors(device, _encode_device(device, values)))
+
+# The (position, length) of each field of the device in the encoded state, None
+# for the fields that aren't encoded
+@functools.cache
+def _device_layout(device: str) -> tuple[tuple[int, int] | None, ...]:
+    layout = {field: (position, length) for field, position, length in spec.load().layout}
+    return tuple(layout.get(field) for field in _DEVICE_FIELDS[device])
+
+def _encode_device(device: str, values: tuple[int, ...]) -> int:
+    return sum(value * placement[0] for value, placement in zip(values, _device_layout(device)) if placement is not None)
+
+# Same as solver.is_solution but performs the commands by looking them up from
+# the per-device tables, which is much faster for replaying many solutions.
+def replays_to(solution: list[Command], state: State, endstate: State) -> bool:
+    values = [_DEVICE_GETTERS[device](state) for device in DEVICES]
+    for command in solution:
+        new_values = [device_steps(device, device_values)[command.value]
+                      for device, device_values in zip(DEVICES, values)]
+        if None in new_values or new_values == values:
+            return False
+        values = new_values
+    return values == [_DEVICE_GETTERS[device](endstate) for device in DEVICES]
+
+def device_values(device: str, state: State) -> tuple[int, ...]:
+    return _DEVICE_GETTERS[device](state)
+
+# Bitmask of the commands that change the given state
+def applicable_mask(state: State) -> int:
+    changing = 0
+    forbidden = 0
+    for device in DEVICES:
+        device_changing, device_forbidden = _device_masks(device, _DEVICE_GETTERS[device](state))
+        changing |= device_changing
+        forbidden |= device_forbidden
+    return changing & ~forbidden
+
+def command_mask(commands) -> int:
+    mask = 0
+    for command in commands:
+        mask |= 1 << command.value
+    return mask
+
+# The commands in the bitmask, in ascending order
+@functools.lru_cache(maxsize=APPLICABILITY_INDEX_SIZE)
+def commands_in_mask(mask: int) -> tuple[Command, ...]:
+    return tuple(command for command in COMMANDS if mask >> command.value & 1)
+
+# Fingerprint of the transition model: a hash of COMMANDS and of every
+# transition from a fixed sample of states, both as told by perform_command and
+# by the spec, so that a change to either one is seen. Anything derived from
+# the model, e.g. the cache, is only valid for models of the same fingerprint.
+FINGERPRINT_SAMPLE_SIZE = 64
+
+@functools.cache
+def model_fingerprint() -> bytes:
+    import hashlib
+    import random
+    generator = random.Random(0)
+    digest = hashlib.sha256()
+    for command, (executable, side_effect) in COMMANDS.items():
+        digest.update("{} {} {} {}\n".format(command.name, command.value, executable, side_effect).encode())
+    for n in range(FINGERPRINT_SAMPLE_SIZE):
+        if n % 2 == 0: # absolute states, see graph.py
+            encoded = generator.randrange(BACKLED_REL_BRIGHTNESS) \
+                + generator.randrange(FRONTLED_CALIBRATION_LENGTH) * FRONTLED_CALIBRATION
+        else:
+            encoded = generator.randrange(STATE_MAX_SIZE + 1)
+        state = decode_state(encoded)
+        for command in COMMANDS:
+            new_state = perform_command(state, command)
+            digest.update((-1 if new_state is state else encode_state(new_state)).to_bytes(8, byteorder='big', signed=True))
+        for successor in spec.load().successors(encoded):
+            digest.update((-1 if successor is None else successor).to_bytes(8, byteorder='big', signed=True))
+    return digest.digest()[:8]